@@ -0,0 +1,53 @@
+"""Bounded per-client history with O(1) append and membership.
+
+Usage:
+
+    from app.libs.client_history import ClientHistory
+
+    history = ClientHistory(50)
+    history.append("corp-001")
+    "corp-001" in history  # -> True
+"""
+
+from collections import deque
+from typing import Dict, Iterator
+
+
+class ClientHistory:
+    """Ring of the last `maxlen` IDs plus a count per ID.
+
+    IDs can repeat (e.g. when selection had to relax history), so membership
+    is backed by counts rather than a plain set.
+    """
+
+    __slots__ = ("_ring", "_counts")
+
+    def __init__(self, maxlen: int):
+        if maxlen <= 0:
+            raise ValueError(f"History size must be positive, got {maxlen}")
+        self._ring: deque = deque(maxlen=maxlen)
+        self._counts: Dict[str, int] = {}
+
+    @property
+    def maxlen(self) -> int:
+        return self._ring.maxlen
+
+    def append(self, item_id: str) -> None:
+        if len(self._ring) == self._ring.maxlen:
+            evicted = self._ring[0]
+            remaining = self._counts[evicted] - 1
+            if remaining:
+                self._counts[evicted] = remaining
+            else:
+                del self._counts[evicted]
+        self._ring.append(item_id)
+        self._counts[item_id] = self._counts.get(item_id, 0) + 1
+
+    def __contains__(self, item_id: object) -> bool:
+        return item_id in self._counts
+
+    def __len__(self) -> int:
+        return len(self._ring)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._ring)
@@ -0,0 +1,1385 @@
+"""Shared selection engine behind the /jaas and /raas APIs.
+
+Usage:
+
+    from app.libs import engine
+
+    topic = engine.resolve_topic(topic, context)
+    selected = engine.select_and_record(client_ip, topic, context, tone, intensity, length)
+    body = engine.ResponseEncoder("justification", "justifications").encode(selected, topic)
+
+The engine owns the curated library, templates and their precomputed indexes,
+and all selection state: the request counter, the rolling window with its
+cooldowns and caps, and per-client history. Every API built on it therefore
+shares one view of that state, and the corpus is loaded and indexed once.
+"""
+
+from pydantic import BaseModel, Field
+from typing import Container, FrozenSet, Optional, List, Dict, Mapping, Set, Tuple, Union
+import functools
+import hashlib
+import itertools
+import json
+import random
+import re
+import time
+import zlib
+from enum import Enum
+from types import MappingProxyType
+
+from app.libs.client_history import ClientHistory
+from shared.lru_store import ShardedLruTtlStore
+from app.libs.http_cache import PrecomputedResponse
+from app.libs.limits import MAX_BATCH_SIZE
+from app.libs.selection_rules import RuleEngine, SelectionRule
+from app.libs.sharded_lock import ShardedLock
+from shared.startup import LAZY_STARTUP
+
+# --- Global State for Advanced Selection Logic ---
+# Requests from every API built on the engine run concurrently. The counter is
+# atomic, and per-client state is guarded by CLIENT_LOCKS shards and stored in
+# a store sharded the same way. The rule engine's lock is the one process-wide
+# lock left: the rolling window and cooldowns are a single global sequence
+# (the 1% cap is a share of everyone's last 1000 selections), so its updates
+# must be serialized. Its critical section is a few counter updates.
+
+# Selections a request may retry when the rules refuse to record its pick
+MAX_RESELECTS = 8
+
+# Monotonic counter for cooldown tracking. next() on itertools.count is atomic,
+# so concurrent requests never lose an increment.
+REQUEST_COUNTER = itertools.count(1)
+
+# Constants for Special Handling
+BEES_ID = "unhinged-001"
+NO_VARIANTS = {
+    "deadpan-001", "deadpan-001-v2", "deadpan-001-v3", "deadpan-001-v4"
+}
+
+# Cooldowns and frequency caps. Any library entry, variant family or template
+# (via its optional id) can be targeted; see app.libs.selection_rules.
+SELECTION_RULES: List[SelectionRule] = [
+    SelectionRule(name="bees", ids={BEES_ID}, cooldown_requests=200),
+    SelectionRule(name="no_variants", ids=NO_VARIANTS, max_share=0.01),  # Max 1% (10 per 1000)
+]
+
+# Global rolling window of recent response codes (for frequency caps) is owned
+# by the rule engine, which keeps the blocked set up to date incrementally.
+GLOBAL_WINDOW_SIZE = 1000
+RULE_ENGINE = RuleEngine(GLOBAL_WINDOW_SIZE)
+GLOBAL_ROLLING_WINDOW = RULE_ENGINE.window
+
+# --- Client History ---
+
+# Per-client state is bounded (LRU + TTL eviction, hard memory ceiling) so
+# rotating client IPs cannot grow it without limit. See shared.lru_store.
+# Rate limiting happens before routing, in databutton_app.mw.rate_limit_mw.
+MAX_TRACKED_CLIENTS = 100_000
+
+# In-memory history: {ip: ClientHistory([id1, id2, ...])}
+# Bounded ring + counts, so update and membership are O(1) at any size
+HISTORY_SIZE = 50  # Increased from 10 to 50 to reduce repetition
+HISTORY_TTL = 60 * 60  # seconds idle before a client's history is dropped
+# Sharded like CLIENT_LOCKS, so clients on different shards share no lock
+CLIENT_SHARDS = 64
+recent_history: ShardedLruTtlStore[ClientHistory] = ShardedLruTtlStore(
+    shards=CLIENT_SHARDS,
+    max_entries=MAX_TRACKED_CLIENTS,
+    ttl=HISTORY_TTL,
+    max_bytes=256 * 1024 * 1024,
+    entry_bytes=160 * HISTORY_SIZE,  # Full ring + counts, roughly
+)
+EMPTY_HISTORY = ClientHistory(1)
+
+# Serializes select + history update per client (sharded, not global)
+CLIENT_LOCKS = ShardedLock(CLIENT_SHARDS)
+
+def update_history(ip: str, justification_id: str):
+    history = recent_history.get(ip)
+    if history is None:
+        history = recent_history[ip] = ClientHistory(HISTORY_SIZE)
+    
+    history.append(justification_id)  # Evicts the oldest once full
+
+def get_history(ip: str) -> ClientHistory:
+    return recent_history.get(ip, EMPTY_HISTORY)
+
+# --- Enums & Models ---
+
+class Tone(str, Enum):
+    snarky = "snarky"
+    absurd = "absurd"
+    deadpan = "deadpan"
+    corporate_parody = "corporate-parody"
+    unhinged = "unhinged"
+
+class Topic(str, Enum):
+    change_request = "change_request"
+    security_exception = "security_exception"
+    budget = "budget"
+    priority = "priority"
+    meeting = "meeting"
+    vendor_request = "vendor_request"
+    process_policy = "process_policy"
+    staffing = "staffing"
+    timeline = "timeline"
+    generic = "generic"
+
+class Length(str, Enum):
+    one_liner = "one_liner"
+    short = "short"
+    medium = "medium"
+
+class Format(str, Enum):
+    plain = "plain"
+    json = "json"
+
+class StreamFormat(str, Enum):
+    ndjson = "ndjson"
+    sse = "sse"
+
+STREAM_MEDIA_TYPES = {
+    StreamFormat.ndjson: "application/x-ndjson",
+    StreamFormat.sse: "text/event-stream",
+}
+
+# Parameters for one selection, as accepted by batch and websocket requests
+# (same semantics as the GET query parameters)
+class SelectionParams(BaseModel):
+    topic: Optional[Topic] = None
+    context: Optional[str] = None
+    tone: Optional[Tone] = None
+    intensity: Optional[int] = Field(None, ge=1, le=5)
+    length: Optional[Length] = None
+    seed: Optional[int] = None
+
+class BatchRequest(BaseModel):
+    items: List[SelectionParams] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+# --- Compact Selection Records ---
+# Selection-time data uses plain __slots__ records with small integer codes
+# instead of pydantic models. Enums are decoded only at the response boundary
+# (see ResponseEncoder).
+
+TONES: Tuple[Tone, ...] = tuple(Tone)
+TONE_CODES: Dict[Tone, int] = {t: i for i, t in enumerate(TONES)}
+
+LENGTHS: Tuple[Length, ...] = tuple(Length)
+LENGTH_CODES: Dict[Length, int] = {l: i for i, l in enumerate(LENGTHS)}
+
+# Topic membership is a bitmask over Topic; free-form topics (e.g. "roadmap")
+# are kept in `topics` for listing but have no bit.
+TOPIC_BITS: Dict[str, int] = {t.value: 1 << i for i, t in enumerate(Topic)}
+GENERIC_TOPIC_BIT = TOPIC_BITS[Topic.generic.value]
+
+def encode_intensity(intensity: int) -> int:
+    if not 1 <= intensity <= 5:
+        raise ValueError(f"Intensity must be 1-5, got {intensity}")
+    return intensity
+
+class JustificationEntry:
+    __slots__ = (
+        "id", "text", "tone", "topics", "topic_mask",
+        "intensity", "length", "safe_for_work", "source", "code", "encoded",
+    )
+
+    def __init__(
+        self,
+        id: str,
+        text: str,
+        tone: Tone,
+        topics: List[str],
+        intensity: int,
+        length: Length,
+        safe_for_work: bool = True,
+        source: str = "library"
+    ):
+        self.id = id
+        self.text = text
+        self.tone = TONE_CODES[Tone(tone)]
+        self.topics = tuple(topics)
+        self.topic_mask = 0
+        for t in topics:
+            self.topic_mask |= TOPIC_BITS.get(t, 0)
+        self.intensity = encode_intensity(intensity)
+        self.length = LENGTH_CODES[Length(length)]
+        self.safe_for_work = safe_for_work
+        self.source = source
+        self.code = -1  # Assigned by index_corpus()
+        self.encoded: Optional[Tuple[bytes, bytes]] = None  # Set by index_corpus()
+
+    def __repr__(self) -> str:
+        return f"JustificationEntry(id={self.id!r}, text={self.text!r})"
+
+# --- Data (Curated Library) ---
+# Updating topics to match new Enums where possible
+JUSTIFICATIONS: List[JustificationEntry] = [
+    JustificationEntry(
+        id="corp-001",
+        text="We’re deprioritizing that until the next alignment on alignment.",
+        tone=Tone.corporate_parody,
+        topics=["priority", "roadmap", "meeting"],
+        intensity=2,
+        length=Length.one_liner
+    ),
+    JustificationEntry(
+        id="corp-002",
+        text="Let's circle back to this when we have more bandwidth to leverage our synergies.",
+        tone=Tone.corporate_parody,
+        topics=["meeting", "roadmap", "budget"],
+        intensity=1,
+        length=Length.one_liner
+    ),
+    # Micro-variants for Alignment (corp-001)
+    JustificationEntry(
+        id="corp-001-v2",
+        text="This has been deprioritized pending a future alignment on alignment.",
+        tone=Tone.corporate_parody,
+        topics=["priority", "roadmap", "meeting"],
+        intensity=2,
+        length=Length.one_liner
+    ),
+    JustificationEntry(
+        id="corp-001-v3",
+        text="Leadership agreed this should wait until alignment is realigned.",
+        tone=Tone.corporate_parody,
+        topics=["priority", "roadmap", "meeting"],
+        intensity=2,
+        length=Length.one_liner
+    ),
+    JustificationEntry(
+        id="corp-001-v4",
+        text="Alignment remains unresolved, so this cannot proceed.",
+        tone=Tone.corporate_parody,
+        topics=["priority", "roadmap", "meeting"],
+        intensity=2,
+        length=Length.one_liner
+    ),
+     JustificationEntry(
+        id="absurd-001",
+        text="The moon is in retrograde and the firewall has feelings today.",
+        tone=Tone.absurd,
+        topics=["security_exception", "change_request"],
+        intensity=4,
+        length=Length.one_liner
+    ),
+    JustificationEntry(
+        id="absurd-002",
+        text="Our cloud provider is currently migrating to a potato-based infrastructure.",
+        tone=Tone.absurd,
+        topics=["change_request", "timeline"],
+        intensity=5,
+        length=Length.short
+    ),
+    JustificationEntry(
+        id="snarky-001",
+        text="I could do that, but then I'd have to care, and that's not in the budget.",
+        tone=Tone.snarky,
+        topics=["budget", "staffing"],
+        intensity=3,
+        length=Length.one_liner
+    ),
+    # Variants for No (deadpan-001)
+    JustificationEntry(
+        id="deadpan-001",
+        text="No.",
+        tone=Tone.deadpan,
+        topics=["generic"],
+        intensity=2,  # Changed from 5 to 2
+        length=Length.one_liner
+    ),
+    JustificationEntry(
+        id="deadpan-001-v2",
+        text="Negative.",
+        tone=Tone.deadpan,
+        topics=["generic"],
+        intensity=2,  # Changed from 5 to 2
+        length=Length.one_liner
+    ),
+    JustificationEntry(
+        id="deadpan-001-v3",
+        text="Not happening.",
+        tone=Tone.deadpan,
+        topics=["generic"],
+        intensity=2,  # Changed from 5 to 2
+        length=Length.one_liner
+    ),
+    JustificationEntry(
+        id="deadpan-001-v4",
+        text="Denied.",
+        tone=Tone.deadpan,
+        topics=["generic"],
+        intensity=2,  # Changed from 5 to 2
+        length=Length.one_liner
+    ),
+    JustificationEntry(
+        id="deadpan-002",
+        text="That is not going to happen.",
+        tone=Tone.deadpan,
+        topics=["generic"],
+        intensity=3,
+        length=Length.one_liner
+    ),
+    JustificationEntry(
+        id="unhinged-001",
+        text="THE BEES ARE IN THE SERVER ROOM AGAIN!",
+        tone=Tone.unhinged,
+        topics=["change_request", "security_exception"],
+        intensity=5,
+        length=Length.one_liner
+    ),
+    JustificationEntry(
+        id="security-001",
+        text="Security says no because you didn't say the magic word (which is a 64-character hex string).",
+        tone=Tone.snarky,
+        topics=["security_exception"],
+        intensity=3,
+        length=Length.short
+    ),
+    # Variants for Security Magic Word
+    JustificationEntry(
+        id="security-001-v2",
+        text="Access denied. You failed to recite the 64-character hex string of power.",
+        tone=Tone.snarky,
+        topics=["security_exception"],
+        intensity=3,
+        length=Length.short
+    ),
+    JustificationEntry(
+        id="security-001-v3",
+        text="Did you submit the hex string in the comments? No? Then no.",
+        tone=Tone.snarky,
+        topics=["security_exception"],
+        intensity=3,
+        length=Length.short
+    ),
+    JustificationEntry(
+        id="budget-001",
+        text="The CFO laughed for a solid five minutes when I asked.",
+        tone=Tone.deadpan,
+        topics=["budget", "vendor_request"],
+        intensity=4,
+        length=Length.short
+    ),
+     # Variants for Budget Laughter
+    JustificationEntry(
+        id="budget-001-v2",
+        text="I mentioned this to Finance and they are still laughing.",
+        tone=Tone.deadpan,
+        topics=["budget", "vendor_request"],
+        intensity=4,
+        length=Length.short
+    ),
+    JustificationEntry(
+        id="budget-001-v3",
+        text="The request was rejected due to excessive hilarity in the finance department.",
+        tone=Tone.deadpan,
+        topics=["budget", "vendor_request"],
+        intensity=4,
+        length=Length.short
+    )
+]
+
+# --- Template Engine Data ---
+
+# Organized by Topic for better relevance
+THINGS_BY_TOPIC = {
+    Topic.change_request: [
+        "this change request", "your deployment", "the emergency fix", 
+        "that hotfix", "the CAB ticket", "your PR"
+    ],
+    Topic.security_exception: [
+        "this security exception", "your risk acceptance", "that firewall rule", 
+        "admin access", "the audit finding", "compliance check"
+    ],
+    Topic.budget: [
+        "this budget request", "the expense report", "funding for this", 
+        "the procurement", "your license request", "the credit card charge"
+    ],
+    Topic.priority: [
+        "this feature", "your ticket", "that user story", 
+        "the roadmap item", "this initiative", "the quarterly goal"
+    ],
+    Topic.meeting: [
+        "that meeting invite", "the standup", "the sync", 
+        "your calendar hold", "the workshop", "the brainstorm"
+    ],
+    Topic.vendor_request: [
+        "this new tool", "the SaaS renewal", "that vendor demo", 
+        "the POC", "another license", "this subscription"
+    ],
+    Topic.process_policy: [
+        "this procedure", "the policy waiver", "your request", 
+        "the new process", "skipping the step", "the governance review"
+    ],
+    Topic.staffing: [
+        "the new headcount", "your hiring request", "the backfill", 
+        "more resources", "the contractor", "expanding the team"
+    ],
+    Topic.timeline: [
+        "the deadline", "your timeline", "the launch date", 
+        "the schedule", "delivery by Friday", "the milestone"
+    ],
+    Topic.generic: [
+        "this request", "your ticket", "that thing", 
+        "the item", "your ask", "the deliverable"
+    ]
+}
+
+# A slot value is plain text, or (text, weight) to make it more or less likely
+SlotValue = Union[str, Tuple[str, float]]
+
+SLOTS: Dict[str, List[SlotValue]] = {
+    # THING is now handled dynamically based on Topic
+    "ABSURD_REASON": [
+        "the VPN is allergic to Thursdays", "Mercury is in retrograde", 
+        "the firewall has feelings", "the datacenter is haunted", 
+        "our astrological charts don't align", "the wifi runs on hopes and dreams",
+        "the server hamsters are on strike", "entropy is increasing too fast",
+        "the coffee machine is updating its firmware", "solar flares are interfering with the Jira ticket",
+        "the blockchain is too heavy", "I'm currently mining bitcoin on the production server",
+        "the AI became sentient and said no", "we ran out of cloud"
+    ],
+    "CORPORATE_BS": [
+        "we need to align on alignment", "the synergies aren't synergistic enough",
+        "it's not in the Q4 strategic pillar", "we are pivoting to a new paradigm",
+        "cross-functional stakeholders have not signed off", "the bandwidth is constrained",
+        "we are right-sizing the resource allocation", "it's below the cut-line",
+        "we need to socialize this with leadership first", "the ROI is not fully realized"
+    ],
+    "SNARKY_RETORT": [
+        "I just don't want to", "that sounds like a 'you' problem",
+        "my care cup is empty", "I'm busy doing literally anything else",
+        "read the manual", "I'm on a coffee break until 2025",
+        "it works on my machine", "ticket closed: won't fix"
+    ],
+    "AUTHORITY": [
+        "Legal", "The Change Advisory Council", "The vibes", 
+        "The ancient ones", "Compliance", "Security", "HR", 
+        "The Algorithm", "Chat-GPT", "The Senior Architect", 
+        "The Board of Directors", "My cat", "The intern"
+    ],
+    "DECREE": [
+        "absolutely not", "try again after Mercury calms down", 
+        "it is forbidden", "we must wait for the stars to align",
+        "computer says no", "maybe in Q5", "it is not the way",
+        "ask again in the next life", "error 418: I'm a teapot",
+        "reply hazy, try again"
+    ]
+}
+
+# --- Compiled Template Engine ---
+# Template and slot texts are parsed once into segments: literal strings and
+# SlotRefs. Rendering is then a single pass that fills each SlotRef and joins.
+# Slot values may be weighted, given as (text, weight) pairs, and may contain
+# slots themselves (nested), e.g. "{AUTHORITY} said {DECREE}".
+
+THING_SLOT = "THING"
+MAX_SLOT_DEPTH = 8
+
+# Unseeded requests share this generator; seeded ones get their own (see select_seeded)
+RNG = random.Random()
+
+class SlotRef:
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+# A compiled text: a plain string if it has no slots, otherwise its segments
+Segments = Union[str, Tuple[Union[str, SlotRef], ...]]
+
+class Slot:
+    """Compiled slot: pre-parsed values plus optional cumulative weights."""
+    __slots__ = ("name", "values", "cum_weights")
+
+    def __init__(self, name: str, values: List[SlotValue]):
+        if not values:
+            raise ValueError(f"Slot {name} has no values")
+        texts = [v if isinstance(v, str) else v[0] for v in values]
+        weights = [1.0 if isinstance(v, str) else float(v[1]) for v in values]
+        self.name = name
+        self.values: Tuple[Segments, ...] = tuple(compile_text(t) for t in texts)
+        self.cum_weights: Optional[List[float]] = None
+        if any(w != 1.0 for w in weights):
+            self.cum_weights = list(itertools.accumulate(weights))
+
+    def pick(self, rng: random.Random) -> Segments:
+        if self.cum_weights is None:
+            return rng.choice(self.values)
+        return rng.choices(self.values, cum_weights=self.cum_weights)[0]
+
+_SLOT_PATTERN = re.compile(r"\{([A-Z_]+)\}")
+
+def compile_text(text: str) -> Segments:
+    segments: List[Union[str, SlotRef]] = []
+    pos = 0
+    for m in _SLOT_PATTERN.finditer(text):
+        name = m.group(1)
+        if name != THING_SLOT and name not in SLOTS:
+            continue  # Unknown placeholders are left as literal text
+        if m.start() > pos:
+            segments.append(text[pos:m.start()])
+        segments.append(SlotRef(name))
+        pos = m.end()
+    if not segments:
+        return text
+    if pos < len(text):
+        segments.append(text[pos:])
+    return tuple(segments)
+
+def compile_slots() -> Dict[str, Slot]:
+    compiled = {name: Slot(name, values) for name, values in SLOTS.items()}
+
+    # Reject cyclic nesting up front so rendering can never loop
+    def visit(name: str, path: Tuple[str, ...]):
+        if name in path:
+            raise ValueError(f"Slot cycle: {' -> '.join(path + (name,))}")
+        if len(path) >= MAX_SLOT_DEPTH:
+            raise ValueError(f"Slot nesting deeper than {MAX_SLOT_DEPTH}: {name}")
+        for value in compiled[name].values:
+            if isinstance(value, tuple):
+                for seg in value:
+                    if isinstance(seg, SlotRef) and seg.name != THING_SLOT:
+                        visit(seg.name, path + (name,))
+
+    for name in compiled:
+        visit(name, ())
+    return compiled
+
+COMPILED_SLOTS: Dict[str, Slot] = compile_slots()
+THING_SLOTS_BY_TOPIC: Dict[Topic, Slot] = {
+    topic: Slot(THING_SLOT, values) for topic, values in THINGS_BY_TOPIC.items()
+}
+
+def render_segments(
+    segments: Segments,
+    thing_slot: Slot,
+    chosen: Dict[str, str],
+    rng: random.Random
+) -> str:
+    """
+    Fills slots in one pass. Each slot name gets a single value per render
+    (shared across repeats and nesting levels) via `chosen`.
+    """
+    if isinstance(segments, str):
+        return segments
+    parts = []
+    for seg in segments:
+        if isinstance(seg, str):
+            parts.append(seg)
+            continue
+        value = chosen.get(seg.name)
+        if value is None:
+            slot = thing_slot if seg.name == THING_SLOT else COMPILED_SLOTS[seg.name]
+            value = render_segments(slot.pick(rng), thing_slot, chosen, rng)
+            chosen[seg.name] = value
+        parts.append(value)
+    return "".join(parts)
+
+class Template:
+    __slots__ = ("text", "tone", "intensity", "length", "segments", "context_only", "code", "id", "encoded_meta")
+
+    def __init__(
+        self,
+        text: str,
+        tone: Tone,
+        intensity: int,
+        length: Length,
+        id: Optional[str] = None
+    ):
+        # Optional stable id, only needed to target the template in SELECTION_RULES
+        self.id = id
+        self.text = text
+        self.tone = TONE_CODES[Tone(tone)]
+        self.intensity = encode_intensity(intensity)
+        self.length = LENGTH_CODES[Length(length)]
+        self.segments = compile_text(text)
+        # No slots other than THING: given a context, it always renders the same
+        self.context_only = isinstance(self.segments, str) or all(
+            seg.name == THING_SLOT for seg in self.segments if isinstance(seg, SlotRef)
+        )
+        self.code = -1  # Assigned by index_corpus()
+        # JSON before and after the rendered ID, set by index_corpus()
+        self.encoded_meta: Optional[Tuple[bytes, bytes]] = None
+
+    def __repr__(self) -> str:
+        return f"Template(text={self.text!r})"
+
+TEMPLATES: List[Template] = [
+    Template(
+        text="We can't approve {THING} because {ABSURD_REASON}, and {AUTHORITY} already said {DECREE}.",
+        tone=Tone.absurd,
+        intensity=4,
+        length=Length.medium
+    ),
+    # Variants for Absurd Refusal
+    Template(
+        text="{AUTHORITY} has decreed that {THING} is forbidden because {ABSURD_REASON}.",
+        tone=Tone.absurd,
+        intensity=4,
+        length=Length.medium
+    ),
+    Template(
+        text="Unless {ABSURD_REASON}, {THING} will not happen, says {AUTHORITY}.",
+        tone=Tone.absurd,
+        intensity=4,
+        length=Length.medium
+    ),
+    
+    Template(
+        text="{AUTHORITY} has decided that {THING} is out of scope until {CORPORATE_BS}.",
+        tone=Tone.corporate_parody,
+        intensity=3,
+        length=Length.medium
+    ),
+    # Variants for Corporate Scope
+    Template(
+        text="We are pausing {THING} to ensure {CORPORATE_BS}.",
+        tone=Tone.corporate_parody,
+        intensity=3,
+        length=Length.medium
+    ),
+    Template(
+        text="Regarding {THING}: {CORPORATE_BS}, so we must circle back later.",
+        tone=Tone.corporate_parody,
+        intensity=3,
+        length=Length.medium
+    ),
+
+    Template(
+        text="Sorry, {THING} is blocked because {SNARKY_RETORT}.",
+        tone=Tone.snarky,
+        intensity=2,
+        length=Length.short
+    ),
+    # Variants for Snarky Block
+    Template(
+        text="I'm not doing {THING}. {SNARKY_RETORT}.",
+        tone=Tone.snarky,
+        intensity=2,
+        length=Length.short
+    ),
+    Template(
+        text="Status of {THING}: Blocked. Why? {SNARKY_RETORT}.",
+        tone=Tone.snarky,
+        intensity=2,
+        length=Length.short
+    ),
+
+    Template(
+        text="I asked {AUTHORITY} about {THING} and they said {DECREE}.",
+        tone=Tone.deadpan,
+        intensity=3,
+        length=Length.short
+    ),
+    # Variants for Deadpan Authority
+    Template(
+        text="{AUTHORITY} reviewed {THING}: {DECREE}.",
+        tone=Tone.deadpan,
+        intensity=3,
+        length=Length.short
+    ),
+     Template(
+        text="Update on {THING} from {AUTHORITY}: {DECREE}.",
+        tone=Tone.deadpan,
+        intensity=3,
+        length=Length.short
+    ),
+    
+    # NEW: Unhinged Templates (Intensity 5)
+    Template(
+        text="I tried to process {THING} but the {ABSURD_REASON} and now everything is on fire!",
+        tone=Tone.unhinged,
+        intensity=5,
+        length=Length.medium
+    ),
+    Template(
+        text="DO NOT ASK ABOUT {THING}! {AUTHORITY} is watching us!",
+        tone=Tone.unhinged,
+        intensity=5,
+        length=Length.medium
+    ),
+    Template(
+        text="WHY WOULD YOU WANT {THING}?? The prophecy explicitly forbids it!",
+        tone=Tone.unhinged,
+        intensity=5,
+        length=Length.medium
+    ),
+    Template(
+        text="{THING}?? In this economy?? With these {ABSURD_REASON}?? ABSOLUTELY NOT!",
+        tone=Tone.unhinged,
+        intensity=5,
+        length=Length.medium
+    )
+]
+
+# A selection candidate is either a curated library entry or an unrendered template.
+# Templates stay unrendered through filtering and history checks; only the final
+# winner is materialized.
+Candidate = Union[JustificationEntry, Template]
+
+# --- Helper Functions ---
+
+def generate_from_template(
+    template: Template,
+    topic: Topic = Topic.generic,
+    context: Optional[str] = None,
+    rng: random.Random = RNG
+) -> JustificationEntry:
+    # THING is the caller's context if given (used verbatim, never parsed for
+    # slots), otherwise a topic-specific value picked only when referenced.
+    chosen: Dict[str, str] = {THING_SLOT: context} if context else {}
+    thing_slot = THING_SLOTS_BY_TOPIC.get(topic, THING_SLOTS_BY_TOPIC[Topic.generic])
+    text = render_segments(template.segments, thing_slot, chosen, rng)
+    
+    # Codes were validated when the template loaded, so skip re-encoding
+    entry = JustificationEntry.__new__(JustificationEntry)
+    entry.id = template_id(text)
+    entry.text = text
+    entry.tone = template.tone
+    entry.topics = (topic.value,)
+    entry.topic_mask = TOPIC_BITS[topic.value]
+    entry.intensity = template.intensity
+    entry.length = template.length
+    entry.safe_for_work = True
+    entry.source = "template"
+    entry.code = template.code
+    entry.encoded = None
+    if template.encoded_meta is not None:
+        before_id, after_id = template.encoded_meta
+        entry.encoded = (dump_json(text), b"".join((before_id, entry.id.encode("ascii"), after_id)))
+    return entry
+
+def template_id(text: str) -> str:
+    # Deterministic ID based on the content (non-cryptographic)
+    return f"tpl-{zlib.crc32(text.encode('utf-8')):08x}"
+
+def rendered_id(template: Template, context: Optional[str]) -> Optional[str]:
+    """
+    The ID `template` will render to, when that is known before rendering:
+    only for context-only templates, and only with a context (or no slots at
+    all). Otherwise None, since the rendering depends on the rng.
+    """
+    if not template.context_only:
+        return None
+    if isinstance(template.segments, str):
+        return template_id(template.segments)
+    if not context:
+        return None
+    chosen = {THING_SLOT: context}
+    return template_id(render_segments(template.segments, THING_SLOTS_BY_TOPIC[Topic.generic], chosen, RNG))
+
+# --- Topic Inference ---
+# Keywords per topic, in tie-break order (the original first-match order first).
+# Matching is whole-word with common inflections, so "fix" matches "fixes" but
+# "sub" no longer matches "submit". Topic.generic has no keywords: it is what
+# infer_topic returns when nothing matches.
+TOPIC_KEYWORDS: Dict[Topic, List[str]] = {
+    Topic.change_request: [
+        "cab", "deploy", "freeze", "release", "fix", "hotfix", "patch", "rollout",
+        "rollback", "migration", "change", "pr", "merge",
+    ],
+    Topic.budget: [
+        "budget", "cost", "price", "pay", "buy", "card", "expense", "spend", "spending",
+        "funding", "fund", "invoice", "procurement", "capex", "opex",
+    ],
+    Topic.security_exception: [
+        "firewall", "access", "risk", "security", "audit", "exception", "compliance",
+        "vulnerability", "cve", "mfa", "sso", "admin", "pentest",
+    ],
+    Topic.vendor_request: [
+        "tool", "vendor", "saas", "license", "sub", "subscription", "renewal", "demo",
+        "poc", "trial", "supplier",
+    ],
+    Topic.staffing: [
+        "hire", "hiring", "staff", "team", "resource", "headcount", "backfill",
+        "contractor", "intern", "recruit",
+    ],
+    Topic.meeting: [
+        "meet", "meeting", "sync", "calendar", "invite", "standup", "workshop",
+        "brainstorm", "offsite",
+    ],
+    Topic.priority: [
+        "priority", "prioritize", "prioritization", "roadmap", "feature", "backlog",
+        "urgent", "initiative", "okr", "p0", "p1",
+    ],
+    Topic.process_policy: [
+        "policy", "process", "procedure", "governance", "waiver", "sop", "workflow",
+        "guideline", "approval",
+    ],
+    Topic.timeline: [
+        "deadline", "timeline", "schedule", "launch", "milestone", "eta", "delay",
+        "due", "friday", "eod", "eow",
+    ],
+}
+
+_TOPIC_ORDER: Dict[Topic, int] = {topic: i for i, topic in enumerate(TOPIC_KEYWORDS)}
+
+def keyword_pattern(keyword: str) -> str:
+    """A keyword's regex; consonant + "y" endings also match "-ies"/"-ied" (policy -> policies)."""
+    if len(keyword) > 2 and keyword.endswith("y") and keyword[-2] not in "aeiou":
+        return re.escape(keyword[:-1]) + "(?:y|ies|ied)"
+    return re.escape(keyword)
+
+def compile_topic_pattern() -> "re.Pattern[str]":
+    """
+    One regex for all topics: a named group per topic, longest keywords first,
+    anchored on word boundaries and allowing common suffixes.
+    """
+    groups = []
+    for topic, keywords in TOPIC_KEYWORDS.items():
+        alternatives = "|".join(keyword_pattern(k) for k in sorted(keywords, key=len, reverse=True))
+        groups.append(f"(?P<{topic.name}>{alternatives})")
+    return re.compile(r"\b(?:" + "|".join(groups) + r")(?:s|es|d|ed|ing|ment|ments)?\b")
+
+TOPIC_PATTERN = compile_topic_pattern()
+
+# Contexts are unbounded query strings, so only short ones are cached: the
+# cache then holds at most TOPIC_CACHE_SIZE * TOPIC_CACHE_MAX_CHARS characters
+TOPIC_CACHE_SIZE = 4096
+TOPIC_CACHE_MAX_CHARS = 256
+
+def _score_topics(normalized: str) -> Tuple[Tuple[Topic, int], ...]:
+    scores: Dict[Topic, int] = {}
+    for m in TOPIC_PATTERN.finditer(normalized):
+        topic = Topic[m.lastgroup]
+        scores[topic] = scores.get(topic, 0) + 1
+    return tuple(sorted(scores.items(), key=lambda kv: (-kv[1], _TOPIC_ORDER[kv[0]])))
+
+_score_topics_cached = functools.lru_cache(maxsize=TOPIC_CACHE_SIZE)(_score_topics)
+
+def infer_topics(context: str) -> Tuple[Tuple[Topic, int], ...]:
+    """Returns (topic, score) pairs for every matched topic, best first."""
+    normalized = " ".join(context.lower().split())
+    # Short contexts repeat a lot (e.g. "Q4 budget"); long ones are scored directly
+    if len(normalized) <= TOPIC_CACHE_MAX_CHARS:
+        return _score_topics_cached(normalized)
+    return _score_topics(normalized)
+
+def infer_topic(context: str) -> Topic:
+    for topic, _ in infer_topics(context):
+        if topic != Topic.generic:
+            return topic
+    
+    return Topic.generic
+
+def get_systemic_blocklist(request_index: int) -> Container[int]:
+    """
+    Returns the codes currently excluded by hard constraints that can NEVER be
+    bypassed (Caps, Cooldowns). Expired cooldowns are lifted first.
+    """
+    RULE_ENGINE.expire(request_index, time.monotonic())
+    return RULE_ENGINE.blocked
+
+def record_selection(selected: JustificationEntry, request_index: int, force: bool = False) -> bool:
+    """
+    Updates the global window and starts any cooldowns the selection triggers.
+    Returns False, recording nothing, if a concurrent request's selection has
+    ruled it out since the blocklist was read (see RuleEngine.record).
+    """
+    return RULE_ENGINE.record(selected.code, request_index, time.monotonic(), force)
+
+def filter_library(
+    topic: Topic,
+    tone: Optional[Tone],
+    intensity: Optional[int],
+    length: Optional[Length]
+) -> List[JustificationEntry]:
+    lib_candidates = JUSTIFICATIONS
+    if tone:
+        tone_code = TONE_CODES[tone]
+        lib_candidates = [r for r in lib_candidates if r.tone == tone_code]
+    if length:
+        length_code = LENGTH_CODES[length]
+        lib_candidates = [r for r in lib_candidates if r.length == length_code]
+    
+    # Topic Filtering
+    if topic != Topic.generic:
+        topic_mask = TOPIC_BITS[topic.value] | GENERIC_TOPIC_BIT
+        lib_candidates = [r for r in lib_candidates if r.topic_mask & topic_mask]
+    
+    # Intensity Filtering & Gating
+    if intensity is not None:
+        if intensity >= 4:
+            # High intensity: Strict floor > 2
+            lib_candidates = [r for r in lib_candidates if r.intensity > 2]
+            # Preference match
+            lib_candidates = [r for r in lib_candidates if abs(r.intensity - intensity) <= 1]
+            
+        elif intensity <= 2:
+            # Low intensity: Strict ceiling < 4
+            lib_candidates = [r for r in lib_candidates if r.intensity < 4]
+            lib_candidates = [r for r in lib_candidates if abs(r.intensity - intensity) <= 1]
+        else:
+            # Mid intensity
+            lib_candidates = [r for r in lib_candidates if abs(r.intensity - intensity) <= 1]
+            
+    # SPECIAL RULE: "No." variants only eligible if deadpan AND intensity <= 2
+    # This cleans the pool before systemic filters
+    if tone == Tone.deadpan and intensity is not None and intensity <= 2:
+        pass # Eligible
+    elif tone is None and intensity is not None and intensity <= 2:
+         # If tone not specified but intensity low, eligible if they match other criteria
+         pass
+    else:
+        # If tone is NOT deadpan OR intensity > 2, remove No variants
+        lib_candidates = [r for r in lib_candidates if r.id not in NO_VARIANTS]
+
+    return lib_candidates
+
+def filter_templates(
+    tone: Optional[Tone],
+    intensity: Optional[int],
+    length: Optional[Length]
+) -> List[Template]:
+    matching_templates = TEMPLATES
+    if tone:
+        tone_code = TONE_CODES[tone]
+        matching_templates = [t for t in matching_templates if t.tone == tone_code]
+    if length:
+        length_code = LENGTH_CODES[length]
+        matching_templates = [t for t in matching_templates if t.length == length_code]
+        
+    if intensity is not None:
+        if intensity >= 4:
+            matching_templates = [t for t in matching_templates if t.intensity > 2]
+            matching_templates = [t for t in matching_templates if abs(t.intensity - intensity) <= 1]
+        elif intensity <= 2:
+            matching_templates = [t for t in matching_templates if t.intensity < 4]
+            matching_templates = [t for t in matching_templates if abs(t.intensity - intensity) <= 1]
+        else:
+             matching_templates = [t for t in matching_templates if abs(t.intensity - intensity) <= 1]
+
+    return matching_templates
+
+# --- Candidate Pool Cache ---
+# The parameter space is small (topic x tone-or-None x intensity-or-None x length-or-None),
+# so every eligible library/template pool is computed once up front and requests
+# only do a dict lookup. The table is immutable; warm_candidate_pools() swaps it wholesale.
+# With LAZY_STARTUP the tables stay empty and each pool is built on first use
+# instead (kept in the BUILT_* dicts, which the parameter space bounds).
+
+PoolKey = Tuple[Topic, Optional[Tone], Optional[int], Optional[Length]]
+CandidatePool = Tuple[Tuple[JustificationEntry, ...], Tuple[Template, ...]]
+
+CANDIDATE_POOLS: Mapping[PoolKey, CandidatePool] = MappingProxyType({})
+BUILT_CANDIDATE_POOLS: Dict[PoolKey, CandidatePool] = {}
+
+def build_candidate_pool(
+    topic: Topic,
+    tone: Optional[Tone],
+    intensity: Optional[int],
+    length: Optional[Length]
+) -> CandidatePool:
+    return (
+        tuple(filter_library(topic, tone, intensity, length)),
+        tuple(filter_templates(tone, intensity, length)),
+    )
+
+# --- Relaxation Tiers ---
+# Each candidate in a relaxation pool is tagged with the strictest level whose
+# pool contains it, and pools are ordered by that level:
+#   RELAX_STRICT    - (topic, tone, intensity, length)        Levels 1/2
+#   RELAX_TOPIC     - (generic, tone, intensity, length)      Level 3
+#   RELAX_INTENSITY - (generic, tone, None, length), keeping
+#                     intensity >= 3 if the client asked for >= 4   Level 4
+#   RELAX_TONE      - (generic, None, None, length)           Level 5
+# Per-client history splits the first three levels in two (fresh first), which
+# gives the seven selection tiers: strict, history-relaxed, topic-relaxed, ...,
+# tone-relaxed. Level 5 never consulted history, so RELAX_TONE is a single tier.
+RELAX_STRICT, RELAX_TOPIC, RELAX_INTENSITY, RELAX_TONE = range(4)
+TIER_COUNT = 2 * RELAX_TONE + 1
+
+RelaxationPool = Tuple[Tuple[Candidate, int], ...]
+
+RELAXATION_POOLS: Mapping[PoolKey, RelaxationPool] = MappingProxyType({})
+BUILT_RELAXATION_POOLS: Dict[PoolKey, RelaxationPool] = {}
+
+def build_relaxation_pool(
+    topic: Topic,
+    tone: Optional[Tone],
+    intensity: Optional[int],
+    length: Optional[Length]
+) -> RelaxationPool:
+    intensity_pool = get_candidates(Topic.generic, tone, None, length)
+    if intensity and intensity >= 4:
+        # If user asked for 4+, we shouldn't give 1 (and "No." must not leak in)
+        intensity_pool = [c for c in intensity_pool if c.intensity >= 3]
+
+    levels = [
+        get_candidates(topic, tone, intensity, length),
+        get_candidates(Topic.generic, tone, intensity, length),
+        intensity_pool,
+        get_candidates(Topic.generic, None, None, length),
+    ]
+
+    tagged: List[Tuple[Candidate, int]] = []
+    seen: Set[int] = set()
+    for level, candidates in enumerate(levels):
+        for c in candidates:
+            if id(c) not in seen:
+                seen.add(id(c))
+                tagged.append((c, level))
+    return tuple(tagged)
+
+def warm_candidate_pools() -> None:
+    """
+    Builds the full (topic, tone, intensity, length) -> pool lookup tables.
+    Called at import time so the tables are filled before the app reports ready
+    (unless LAZY_STARTUP).
+    """
+    global CANDIDATE_POOLS, RELAXATION_POOLS
+    keys: List[PoolKey] = [
+        (topic, tone, intensity, length)
+        for topic in Topic
+        for tone in [None, *Tone]
+        for intensity in [None, 1, 2, 3, 4, 5]
+        for length in [None, *Length]
+    ]
+    CANDIDATE_POOLS = MappingProxyType({key: build_candidate_pool(*key) for key in keys})
+    RELAXATION_POOLS = MappingProxyType({key: build_relaxation_pool(*key) for key in keys})
+    BUILT_CANDIDATE_POOLS.clear()
+    BUILT_RELAXATION_POOLS.clear()
+
+def get_candidates(
+    topic: Topic,
+    tone: Optional[Tone],
+    intensity: Optional[int],
+    length: Optional[Length]
+) -> List[Candidate]:
+    key = (topic, tone, intensity, length)
+    pool = CANDIDATE_POOLS.get(key)
+    if pool is None:
+        # Table not warmed (lazy startup); a racing request just builds it twice
+        pool = BUILT_CANDIDATE_POOLS.get(key)
+        if pool is None:
+            pool = BUILT_CANDIDATE_POOLS[key] = build_candidate_pool(*key)
+    lib_candidates, matching_templates = pool
+
+    # Library entries first, then templates as unrendered descriptors
+    return [*lib_candidates, *matching_templates]
+
+def materialize(
+    candidate: Candidate,
+    topic: Topic,
+    context: Optional[str],
+    rng: random.Random = RNG
+) -> JustificationEntry:
+    """Renders the selected candidate. Library entries are returned as-is."""
+    if isinstance(candidate, Template):
+        return generate_from_template(candidate, topic, context, rng)
+    return candidate
+
+def select_justification(
+    client_ip: str,
+    topic: Topic,
+    context: Optional[str],
+    tone: Optional[Tone],
+    intensity: Optional[int],
+    length: Optional[Length],
+    request_index: int = 0,
+    rng: random.Random = RNG,
+    rejected: FrozenSet[int] = frozenset()
+) -> JustificationEntry:
+    history = get_history(client_ip)
+    blocked = get_systemic_blocklist(request_index)
+    if rejected:
+        blocked = blocked | rejected
+    return select_from_pool(topic, context, tone, intensity, length, history, blocked, rng)
+
+def select_seeded(
+    topic: Topic,
+    context: Optional[str],
+    tone: Optional[Tone],
+    intensity: Optional[int],
+    length: Optional[Length],
+    seed: int
+) -> JustificationEntry:
+    """
+    Reproducible selection: a pure function of the seed, the parameters and the
+    corpus. History, cooldowns and caps would make the result depend on earlier
+    traffic, so instead every rule-governed entry (BEES, the "No." variants) is
+    always excluded. A seed can therefore never be replayed to get around them.
+    """
+    return select_from_pool(
+        topic, context, tone, intensity, length, EMPTY_HISTORY, RULE_ENGINE.governed,
+        random.Random(seed)
+    )
+
+def select_from_pool(
+    topic: Topic,
+    context: Optional[str],
+    tone: Optional[Tone],
+    intensity: Optional[int],
+    length: Optional[Length],
+    history: Container[str],
+    blocked: Container[int],
+    rng: random.Random
+) -> JustificationEntry:
+    """
+    Picks from the best non-empty relaxation tier in a single scan of the
+    precomputed relaxation pool (see RELAX_* above).
+    """
+    key = (topic, tone, intensity, length)
+    pool = RELAXATION_POOLS.get(key)
+    if pool is None:
+        pool = BUILT_RELAXATION_POOLS.get(key)
+        if pool is None:
+            pool = BUILT_RELAXATION_POOLS[key] = build_relaxation_pool(*key)
+
+    tiers: List[List[Candidate]] = [[] for _ in range(TIER_COUNT)]
+    best_tier = TIER_COUNT
+    for c, level in pool:
+        if 2 * level > best_tier:
+            # Pool is ordered by level; nothing after this can beat best_tier
+            break
+
+        if c.code in blocked:
+            continue
+
+        if level == RELAX_TONE:
+            tier = TIER_COUNT - 1
+        elif isinstance(c, Template):
+            # Rendered template IDs are content hashes that usually only exist
+            # after rendering. Context-only templates render the same text
+            # every time, so those are checked like library entries.
+            rendered = rendered_id(c, context)
+            tier = 2 * level if rendered is None or rendered not in history else 2 * level + 1
+        elif c.id not in history:
+            tier = 2 * level
+        else:
+            tier = 2 * level + 1
+
+        if tier <= best_tier:
+            tiers[tier].append(c)
+            best_tier = tier
+
+    if best_tier == TIER_COUNT:
+        # Fallback of last resort: Generate a fresh safe template
+        tpl = rng.choice(TEMPLATES)
+        return generate_from_template(tpl, Topic.generic, context, rng)
+
+    render_topic = topic if best_tier <= 1 else Topic.generic
+    return materialize(rng.choice(tiers[best_tier]), render_topic, context, rng)
+
+def corpus_version() -> str:
+    """Fingerprint of everything a response can be built from."""
+    h = hashlib.blake2b(digest_size=8)
+    for e in JUSTIFICATIONS:
+        h.update(repr((e.id, e.text, e.tone, e.topics, e.intensity, e.length, e.safe_for_work, e.source)).encode("utf-8"))
+    for t in TEMPLATES:
+        h.update(repr((t.id, t.text, t.tone, t.intensity, t.length)).encode("utf-8"))
+    h.update(repr(sorted(SLOTS.items())).encode("utf-8"))
+    h.update(repr(sorted((topic.value, values) for topic, values in THINGS_BY_TOPIC.items())).encode("utf-8"))
+    # Rules decide which entries seeded selection excludes
+    h.update(repr(sorted(
+        (r.name, sorted(r.ids), sorted(r.families), r.cooldown_requests, r.cooldown_seconds, r.max_share)
+        for r in SELECTION_RULES
+    )).encode("utf-8"))
+    return h.hexdigest()
+
+CORPUS_VERSION = ""  # Set by index_corpus()
+
+def index_corpus() -> None:
+    """
+    Assigns compact integer codes (library entries first, then templates),
+    resolves the selection rules against them and fingerprints the corpus.
+    """
+    global CORPUS_VERSION
+    items = [*JUSTIFICATIONS, *TEMPLATES]
+    for code, item in enumerate(items):
+        item.code = code
+    RULE_ENGINE.load(SELECTION_RULES, [(item.id, item.code) for item in items])
+    CORPUS_VERSION = corpus_version()
+    for entry in JUSTIFICATIONS:
+        entry.encoded = encode_entry(entry)
+    for template in TEMPLATES:
+        template.encoded_meta = encode_template_meta(template)
+    build_metadata()
+
+# --- Serialization ---
+# Response bodies are assembled from pre-encoded byte fragments and are
+# byte-identical to FastAPI's encoding of the APIs' response models. Library
+# entries are encoded once by index_corpus(); rendered templates are encoded
+# when served, with the stdlib C encoder.
+
+def dump_json(value: object) -> bytes:
+    # Same settings as starlette's JSONResponse
+    return json.dumps(
+        value, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+TOPIC_FRAGMENTS: Dict[Optional[Topic], bytes] = {
+    None: b',"topic":null,',
+    **{t: b',"topic":' + dump_json(t.value) + b"," for t in Topic},
+}
+
+def encode_entry(entry: JustificationEntry) -> Tuple[bytes, bytes]:
+    """Returns (text as JSON, everything after the topic field)."""
+    tail = dump_json({
+        "tone": TONES[entry.tone].value,
+        "intensity": entry.intensity,
+        "meta": {"id": entry.id, "source": entry.source, "safe_for_work": entry.safe_for_work},
+    })
+    return dump_json(entry.text), tail[1:]
+
+def encode_template_meta(template: Template) -> Tuple[bytes, bytes]:
+    """The tail fragment of a rendered template, split around its ID."""
+    # Rendered IDs are "tpl-<hex>", so they are spliced in without escaping
+    before_id = b"".join((
+        b'"tone":', dump_json(TONES[template.tone].value),
+        b',"intensity":', dump_json(template.intensity),
+        b',"meta":{"id":"',
+    ))
+    return before_id, b'","source":"template","safe_for_work":true}}'
+
+class ResponseEncoder:
+    """
+    Encodes responses for one API. APIs only differ in the name of the text
+    field ("justification", "rationale") and of the list in batch responses.
+    """
+
+    def __init__(self, text_field: str, list_field: str):
+        self.prefix = b"{" + dump_json(text_field) + b":"
+        self.list_prefix = b"{" + dump_json(list_field) + b":["
+
+    def encode(self, selected: JustificationEntry, topic: Optional[Topic]) -> bytes:
+        text, tail = selected.encoded or encode_entry(selected)
+        return b"".join((self.prefix, text, TOPIC_FRAGMENTS[topic], tail))
+
+    def encode_batch(self, results: List[Tuple[Topic, JustificationEntry]]) -> bytes:
+        items = b",".join([self.encode(selected, topic) for topic, selected in results])
+        return b"".join((self.list_prefix, items, b"]}"))
+
+def encode_text(selected: JustificationEntry) -> bytes:
+    """The body for format=plain: the bare text as a JSON string."""
+    if selected.encoded is not None:
+        return selected.encoded[0]
+    return dump_json(selected.text)
+
+# --- Metadata ---
+# Served as pre-encoded bytes with strong ETags. Rebuilt by index_corpus(), so
+# the bodies (and ETags) only change when the corpus does.
+METADATA_CACHE_CONTROL = "private, max-age=86400"
+# Health must reflect the live process, so clients revalidate every time
+HEALTH_CACHE_CONTROL = "no-cache"
+API_VERSION = "0.1.0"
+
+METADATA: Mapping[str, PrecomputedResponse] = MappingProxyType({})
+
+def build_metadata() -> None:
+    global METADATA
+    # Aggregate all unique topics
+    all_topics = set()
+    for r in JUSTIFICATIONS:
+        all_topics.update(r.topics)
+    topics = sorted(all_topics)
+    tones = [t.value for t in Tone]
+
+    METADATA = MappingProxyType({
+        "health": PrecomputedResponse.json(
+            {"status": "ok", "version": API_VERSION}, cache_control=HEALTH_CACHE_CONTROL
+        ),
+        "topics": PrecomputedResponse.json({"topics": topics}, cache_control=METADATA_CACHE_CONTROL),
+        "tones": PrecomputedResponse.json({"tones": tones}, cache_control=METADATA_CACHE_CONTROL),
+        "meta": PrecomputedResponse.json(
+            {
+                "topics": topics,
+                "tones": tones,
+                "lengths": [l.value for l in Length],
+                "corpus_version": CORPUS_VERSION,
+            },
+            cache_control=METADATA_CACHE_CONTROL,
+        ),
+    })
+
+index_corpus()
+if not LAZY_STARTUP:
+    warm_candidate_pools()
+
+def select_and_record(
+    client_ip: str,
+    topic: Topic,
+    context: Optional[str],
+    tone: Optional[Tone],
+    intensity: Optional[int],
+    length: Optional[Length]
+) -> JustificationEntry:
+    """Selects for a client and applies all post-selection state updates."""
+    # Hold the client's shard so its history check and update are atomic
+    with CLIENT_LOCKS.lock_for(client_ip):
+        return _select_and_record_locked(client_ip, topic, context, tone, intensity, length)
+
+def select_and_record_batch(
+    client_ip: str,
+    items: List[SelectionParams]
+) -> List[Tuple[Topic, JustificationEntry]]:
+    """
+    Runs every item through selection in one pass under a single acquisition of
+    the client's lock. Items are applied in order, so each one sees the history,
+    cooldowns and caps left by the previous ones.
+    """
+    results = []
+    with CLIENT_LOCKS.lock_for(client_ip):
+        for item in items:
+            topic = resolve_topic(item.topic, item.context)
+            if item.seed is not None:
+                selected = select_seeded(
+                    topic, item.context, item.tone, item.intensity, item.length, item.seed
+                )
+            else:
+                selected = _select_and_record_locked(
+                    client_ip, topic, item.context, item.tone, item.intensity, item.length
+                )
+            results.append((topic, selected))
+    return results
+
+def _select_and_record_locked(
+    client_ip: str,
+    topic: Topic,
+    context: Optional[str],
+    tone: Optional[Tone],
+    intensity: Optional[int],
+    length: Optional[Length]
+) -> JustificationEntry:
+    # Global Counter Increment
+    request_index = next(REQUEST_COUNTER)
+
+    # Post-Selection Updates
+
+    # 1. Update Global Window & Cooldowns. The blocklist is read without the
+    # rule engine's lock, so a concurrent request may record a pick that rules
+    # ours out first (e.g. both drew BEES); then select again without it.
+    rejected: FrozenSet[int] = frozenset()
+    for attempt in range(MAX_RESELECTS + 1):
+        selected = select_justification(
+            client_ip, topic, context, tone, intensity, length, request_index, rejected=rejected
+        )
+        # The last resort fallback ignores the blocklist, so never loop forever
+        if record_selection(selected, request_index, force=attempt == MAX_RESELECTS):
+            break
+        rejected |= {selected.code}
+
+    # 2. Update User History
+    update_history(client_ip, selected.id)
+
+    return selected
+
+def select_params(client_ip: str, params: SelectionParams) -> Tuple[Topic, JustificationEntry]:
+    """Single-item selection from a parameter object (seeded or not)."""
+    topic = resolve_topic(params.topic, params.context)
+    if params.seed is not None:
+        return topic, select_seeded(
+            topic, params.context, params.tone, params.intensity, params.length, params.seed
+        )
+    return topic, select_and_record(
+        client_ip, topic, params.context, params.tone, params.intensity, params.length
+    )
+
+def resolve_topic(topic: Optional[Topic], context: Optional[str]) -> Topic:
+    if topic:
+        return topic
+    if context:
+        return infer_topic(context)
+    return Topic.generic
@@ -0,0 +1,279 @@
+"""Routers over the shared selection engine.
+
+Usage:
+
+    from app.libs.engine_api import ApiSpec, create_router
+
+    router = create_router(ApiSpec(
+        path="/jaas",
+        noun="justification",
+        response_model=JustificationResponse,
+        batch_response_model=JustificationBatchResponse,
+        names={"get": "get_justification", ...},
+    ))
+
+Every API gets the same endpoints (GET, batch, stream, websocket and the
+metadata routes) backed by the same engine state. An API only chooses its
+path, the noun that names its response fields, its response models (for the
+OpenAPI schema) and its route names (which name the generated client methods).
+"""
+
+import asyncio
+import time
+from typing import AsyncIterator, Dict, Optional, Type
+
+from fastapi import APIRouter, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+
+from databutton_app.mw.auth_mw import select_websocket_subprotocol
+from databutton_app.mw.rate_limit_mw import (
+    ConnectionLimiter,
+    RateLimit,
+    TokenBucket,
+    charge_rate_limit,
+    wait_rate_limit,
+)
+
+from app.libs import engine
+from app.libs.engine import (
+    BatchRequest,
+    Format,
+    Length,
+    ResponseEncoder,
+    SelectionParams,
+    StreamFormat,
+    Tone,
+    Topic,
+)
+from app.libs.http_cache import EncodedJSONResponse, etag_matches, make_etag, not_modified
+
+# Handlers are `async def`: selection is short, pure CPU work, so running it on
+# the event loop is cheaper than a threadpool hop per request and concurrency
+# is not capped by the threadpool size. Nothing below awaits while holding a
+# lock, so the engine's thread-safe state is equally safe on the loop.
+
+# Seeded responses only change when the corpus does (i.e. on deploy)
+SEEDED_CACHE_CONTROL = "private, max-age=3600"
+
+# Websocket clients authenticate once when connecting (the AuthMiddleware
+# runs on the handshake) and are then limited per connection.
+# The connection cap is shared by all APIs.
+MAX_WS_CONNECTIONS = 1000
+MAX_WS_CONNECTIONS_PER_CLIENT = 4
+WS_RATE_LIMIT = RateLimit(requests=60, period=60, burst=10)
+WS_CONNECTIONS = ConnectionLimiter(MAX_WS_CONNECTIONS, MAX_WS_CONNECTIONS_PER_CLIENT)
+
+ENDPOINTS = ("get", "batch", "stream", "ws", "health", "topics", "tones", "meta")
+
+
+class ApiSpec(BaseModel):
+    # Path of the main endpoint, e.g. "/jaas"; the others are nested under it
+    path: str
+
+    # What the API generates. Names the text field ("justification") and the
+    # list in batch responses ("justifications")
+    noun: str
+
+    # Models describing the (pre-encoded) responses in the OpenAPI schema
+    response_model: Type[BaseModel]
+    batch_response_model: Type[BaseModel]
+
+    # Route name per endpoint (see ENDPOINTS)
+    names: Dict[str, str]
+
+    def encoder(self) -> ResponseEncoder:
+        return ResponseEncoder(self.noun, f"{self.noun}s")
+
+
+def client_host(connection: Request | WebSocket) -> str:
+    return connection.client.host if connection.client else "unknown"
+
+
+def create_router(spec: ApiSpec) -> APIRouter:
+    missing = set(ENDPOINTS) - spec.names.keys()
+    if missing:
+        raise ValueError(f"No route names for {sorted(missing)}")
+
+    router = APIRouter()
+    encoder = spec.encoder()
+    noun = spec.noun
+
+    async def get_one(
+        request: Request,
+        topic: Optional[Topic] = Query(None, description="Preset topic category"),
+        context: Optional[str] = Query(None, description="Specific context (e.g. 'DB migration', 'Q4 budget')"),
+        tone: Optional[Tone] = Query(None, description="Tone of the response"),
+        intensity: Optional[int] = Query(None, ge=1, le=5, description="Intensity level 1-5"),
+        length: Optional[Length] = Query(None, description=f"Length of the {noun}"),
+        format: Format = Query(Format.json, description="Response format: json or plain"),
+        seed: Optional[int] = Query(None, description="Makes the response reproducible and cacheable")
+    ):
+        effective_topic = engine.resolve_topic(topic, context)
+
+        if seed is not None:
+            # The response is fully determined by these, so the ETag is known
+            # before selecting and a revalidation skips selection entirely
+            etag = make_etag(
+                engine.CORPUS_VERSION, noun, seed, effective_topic.value, context,
+                tone and tone.value, intensity, length and length.value, format.value
+            )
+            cache_headers = {"ETag": etag, "Cache-Control": SEEDED_CACHE_CONTROL}
+            if etag_matches(request.headers.get("if-none-match"), etag):
+                return not_modified(cache_headers)
+            selected = engine.select_seeded(effective_topic, context, tone, intensity, length, seed)
+        else:
+            cache_headers = None
+            selected = engine.select_and_record(
+                client_host(request), effective_topic, context, tone, intensity, length
+            )
+
+        if format == Format.plain:
+            return EncodedJSONResponse(engine.encode_text(selected), cache_headers)
+
+        return EncodedJSONResponse(encoder.encode(selected, effective_topic), cache_headers)
+
+    async def get_batch(request: Request, body: BatchRequest):
+        charge_rate_limit(request, len(body.items) - 1)
+        results = engine.select_and_record_batch(client_host(request), body.items)
+        return EncodedJSONResponse(encoder.encode_batch(results))
+
+    async def stream(
+        request: Request,
+        topic: Topic,
+        context: Optional[str],
+        tone: Optional[Tone],
+        intensity: Optional[int],
+        length: Optional[Length],
+        format: StreamFormat,
+        count: Optional[int],
+        interval: float
+    ) -> AsyncIterator[bytes]:
+        # One item in flight at a time: the next one is only selected once the
+        # previous chunk has been sent, so a slow reader throttles generation and
+        # a stream of any length holds no more than one response in memory.
+        client_ip = client_host(request)
+        sent = 0
+        while count is None or sent < count:
+            if sent:
+                await asyncio.sleep(interval)
+                # The middleware charged the first item; the rest wait for tokens
+                await wait_rate_limit(request)
+
+            selected = engine.select_and_record(client_ip, topic, context, tone, intensity, length)
+            sent += 1
+
+            data = encoder.encode(selected, topic)
+            if format == StreamFormat.sse:
+                yield b"id: %d\ndata: %s\n\n" % (sent, data)
+            else:
+                yield data + b"\n"
+
+    async def get_stream(
+        request: Request,
+        topic: Optional[Topic] = Query(None, description="Preset topic category"),
+        context: Optional[str] = Query(None, description="Specific context (e.g. 'DB migration', 'Q4 budget')"),
+        tone: Optional[Tone] = Query(None, description="Tone of the response"),
+        intensity: Optional[int] = Query(None, ge=1, le=5, description="Intensity level 1-5"),
+        length: Optional[Length] = Query(None, description=f"Length of the {noun}"),
+        format: StreamFormat = Query(StreamFormat.ndjson, description="Stream format: ndjson or sse"),
+        count: Optional[int] = Query(None, ge=1, description="Number of items to send (default: until the client disconnects)"),
+        interval: float = Query(1.0, ge=0, le=3600, description="Seconds to wait between items")
+    ):
+        effective_topic = engine.resolve_topic(topic, context)
+
+        return StreamingResponse(
+            stream(request, effective_topic, context, tone, intensity, length, format, count, interval),
+            media_type=engine.STREAM_MEDIA_TYPES[format],
+            # Keep proxies from buffering or caching the stream
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    async def websocket_endpoint(websocket: WebSocket):
+        client_ip = client_host(websocket)
+        if not WS_CONNECTIONS.acquire(client_ip):
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Too many connections")
+            return
+
+        try:
+            await websocket.accept(subprotocol=select_websocket_subprotocol(websocket))
+            bucket = TokenBucket(WS_RATE_LIMIT.capacity, time.monotonic())
+
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+
+                if not bucket.take(WS_RATE_LIMIT, 1, time.monotonic()):
+                    await websocket.send_json({
+                        "error": "Rate limit exceeded. Try again later.",
+                        "retry_after": bucket.retry_after(WS_RATE_LIMIT, 1),
+                    })
+                    continue
+
+                text = message.get("text")
+                if text is None:
+                    await websocket.send_json({
+                        "error": "Invalid parameters",
+                        "detail": "Expected a text frame with JSON parameters",
+                    })
+                    continue
+
+                try:
+                    params = SelectionParams.model_validate_json(text)
+                except ValidationError as e:
+                    await websocket.send_json({
+                        "error": "Invalid parameters",
+                        "detail": e.errors(include_url=False, include_context=False, include_input=False),
+                    })
+                    continue
+
+                effective_topic, selected = engine.select_params(client_ip, params)
+                await websocket.send_text(encoder.encode(selected, effective_topic).decode("utf-8"))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            WS_CONNECTIONS.release(client_ip)
+
+    def metadata(key: str):
+        async def get_metadata(request: Request):
+            return engine.METADATA[key].serve(request.headers.get("if-none-match"))
+        return get_metadata
+
+    names = spec.names
+    router.add_api_route(
+        spec.path,
+        get_one,
+        methods=["GET"],
+        name=names["get"],
+        response_model=spec.response_model,
+        description=f"Generates one {noun}. With format=plain, the body is only its text, as a JSON string.",
+    )
+    router.add_api_route(
+        f"{spec.path}/batch",
+        get_batch,
+        methods=["POST"],
+        name=names["batch"],
+        response_model=spec.batch_response_model,
+        description=(
+            f"Generates one {noun} per item in a single call. Each item counts "
+            f"against the rate limit like a separate GET {spec.path} request."
+        ),
+    )
+    router.add_api_route(
+        f"{spec.path}/stream",
+        get_stream,
+        methods=["GET"],
+        name=names["stream"],
+        description=(
+            f"Streams {noun}s continuously, one JSON object per line (ndjson) or "
+            "per event (sse). Items after the first are paced to the client's rate limit."
+        ),
+    )
+    router.add_api_websocket_route(f"{spec.path}/ws", websocket_endpoint, name=names["ws"])
+    for key in ("health", "topics", "tones", "meta"):
+        router.add_api_route(
+            f"{spec.path}/{key}", metadata(key), methods=["GET"], name=names[key]
+        )
+
+    return router
@@ -0,0 +1,94 @@
+"""ETag helpers for conditional GETs.
+
+Usage:
+
+    from app.libs.http_cache import PrecomputedResponse, etag_matches, make_etag, not_modified
+
+    etag = make_etag(CORPUS_VERSION, seed, topic, tone)
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=3600"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(headers)  # before doing any work
+
+    # Bodies that only change with the data: encode once, serve as bytes
+    TOPICS = PrecomputedResponse.json({"topics": [...]}, cache_control="private, max-age=86400")
+    return TOPICS.serve(request.headers.get("if-none-match"))
+
+ETags are strong validators: a hash over the parts that fully determine the
+response body (or over the body itself), so equal tags mean identical bodies.
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from starlette.responses import Response
+
+
+def make_etag(*parts: object) -> str:
+    digest = hashlib.blake2b(
+        "\x1f".join(str(part) for part in parts).encode("utf-8"), digest_size=12
+    )
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evaluates an If-None-Match header (weak comparison, as RFC 9110 requires)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tag = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == tag
+        for candidate in if_none_match.split(",")
+    )
+
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+class EncodedJSONResponse(Response):
+    """
+    A JSON body that is already encoded. Returning a Response skips FastAPI's
+    serialization, and the headers are built directly.
+    """
+
+    media_type = "application/json"
+
+    def __init__(self, body: bytes, headers: Optional[Dict[str, str]] = None):
+        self.status_code = 200
+        self.background = None
+        self.body = body
+        self.raw_headers = [
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (b"content-type", b"application/json"),
+        ]
+        if headers:
+            self.raw_headers += [
+                (k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()
+            ]
+
+
+class PrecomputedResponse:
+    """A body encoded once, served with a strong ETag and 304 handling."""
+
+    __slots__ = ("body", "media_type", "headers")
+
+    def __init__(self, body: bytes, media_type: str, cache_control: str):
+        self.body = body
+        self.media_type = media_type
+        self.headers = {
+            "ETag": make_etag(hashlib.blake2b(body).hexdigest()),
+            "Cache-Control": cache_control,
+        }
+
+    @classmethod
+    def json(cls, content: Any, cache_control: str) -> "PrecomputedResponse":
+        body = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return cls(body, "application/json", cache_control)
+
+    def serve(self, if_none_match: Optional[str]) -> Response:
+        if etag_matches(if_none_match, self.headers["ETag"]):
+            return not_modified(self.headers)
+        return Response(self.body, media_type=self.media_type, headers=self.headers)
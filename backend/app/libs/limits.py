@@ -0,0 +1,9 @@
+"""Request size limits shared by the engine and the rate limits in main.py.
+
+This module has no imports, so main.py can size its rate limit buckets from
+it without loading the engine (see LAZY_STARTUP).
+"""
+
+# Items per batch request. The "generate" rate limit bucket holds one full
+# batch, so a batch of this size is accepted from a client with a full budget
+MAX_BATCH_SIZE = 500
@@ -0,0 +1,91 @@
+"""Fixed-size rolling window of integer IDs with O(1) per-category counts.
+
+Usage:
+
+    from app.libs.rolling_window import RollingWindow
+
+    window = RollingWindow(1000)
+    window.add_category("no_variants", [3, 4, 5])
+    window.append(4)
+    window.count("no_variants")  # -> 1
+"""
+
+from array import array
+from typing import Dict, Iterable, List, Tuple
+
+EMPTY_SLOT = -1
+
+
+class RollingWindow:
+    """Ring buffer of the last `size` IDs.
+
+    Category counters are updated on append and on eviction, so `count` never
+    scans the window and cost does not depend on the window size.
+    """
+
+    __slots__ = ("size", "_slots", "_pos", "_len", "_category_index", "_counts", "_categories_of")
+
+    def __init__(self, size: int):
+        if size <= 0:
+            raise ValueError(f"Window size must be positive, got {size}")
+        self.size = size
+        self._slots = array("i", [EMPTY_SLOT]) * size
+        self._pos = 0
+        self._len = 0
+        self._category_index: Dict[str, int] = {}
+        self._counts: List[int] = []
+        # ID -> indices of the categories it belongs to
+        self._categories_of: Dict[int, Tuple[int, ...]] = {}
+
+    def add_category(self, name: str, ids: Iterable[int]) -> None:
+        """Registers (or replaces) a counted category. Counts existing slots once."""
+        members = set(ids)
+        if name in self._category_index:
+            index = self._category_index[name]
+            for item, cats in list(self._categories_of.items()):
+                cats = tuple(c for c in cats if c != index)
+                if cats:
+                    self._categories_of[item] = cats
+                else:
+                    del self._categories_of[item]
+        else:
+            index = len(self._counts)
+            self._category_index[name] = index
+            self._counts.append(0)
+
+        for item in members:
+            self._categories_of[item] = self._categories_of.get(item, ()) + (index,)
+        self._counts[index] = sum(1 for item in self if item in members)
+
+    def append(self, item: int) -> int:
+        """Adds `item`, returning the evicted ID (or EMPTY_SLOT)."""
+        evicted = self._slots[self._pos]
+        if evicted != EMPTY_SLOT:
+            for index in self._categories_of.get(evicted, ()):
+                self._counts[index] -= 1
+        else:
+            self._len += 1
+
+        self._slots[self._pos] = item
+        self._pos = (self._pos + 1) % self.size
+        for index in self._categories_of.get(item, ()):
+            self._counts[index] += 1
+        return evicted
+
+    def count(self, name: str) -> int:
+        return self._counts[self._category_index[name]]
+
+    def clear(self) -> None:
+        self._slots = array("i", [EMPTY_SLOT]) * self.size
+        self._pos = 0
+        self._len = 0
+        self._counts = [0] * len(self._counts)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self):
+        """Yields IDs oldest first."""
+        start = self._pos if self._len == self.size else 0
+        for i in range(self._len):
+            yield self._slots[(start + i) % self.size]
@@ -0,0 +1,254 @@
+"""Declarative cooldown and frequency-cap rules for selection.
+
+Usage:
+
+    from app.libs.selection_rules import RuleEngine, SelectionRule
+
+    engine = RuleEngine(window_size=1000)
+    engine.load(
+        [SelectionRule(name="bees", ids={"unhinged-001"}, cooldown_requests=200)],
+        items=[("unhinged-001", 0), ("deadpan-001", 1)],
+    )
+
+    engine.expire(request_index, now)       # once per request, before selecting
+    if code not in engine.blocked: ...       # O(1) eligibility
+    if code not in engine.governed: ...      # ...without depending on traffic
+    if not engine.record(code, request_index, now):  # after selecting
+        ...  # a concurrent selection ruled `code` out since; select again
+
+Rules target entry IDs or ID families (a base ID and its "-vN" variants). A
+rule can put its members on cooldown whenever one of them is selected (for a
+number of requests and/or seconds) and cap their combined share of the
+rolling window. The blocked set only changes when a rule's state changes:
+a cooldown starts or expires, or a cap is reached or released.
+
+The engine is thread-safe: updates are serialized by the engine's own lock,
+and `blocked` is an immutable snapshot that is swapped atomically, so
+readers never take the lock. Because that snapshot can be stale by the time
+a selection is recorded, `record` re-checks the rules under the lock and
+refuses a code that has been ruled out meanwhile. Cooldown deadlines only
+ever move forward, even when requests record out of index order.
+"""
+
+import heapq
+import threading
+from collections import Counter
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from pydantic import BaseModel, model_validator
+
+from app.libs.rolling_window import EMPTY_SLOT, RollingWindow
+
+
+class SelectionRule(BaseModel):
+    name: str
+
+    # Members: exact IDs and/or families ("deadpan-001" -> "deadpan-001", "deadpan-001-v2", ...)
+    ids: Set[str] = set()
+    families: Set[str] = set()
+
+    # Cooldown after any member is selected
+    cooldown_requests: Optional[int] = None
+    cooldown_seconds: Optional[float] = None
+
+    # Max combined share of the rolling window, e.g. 0.01 for 1%
+    max_share: Optional[float] = None
+
+    @model_validator(mode="after")
+    def check_has_effect(self) -> "SelectionRule":
+        if self.cooldown_requests is None and self.cooldown_seconds is None and self.max_share is None:
+            raise ValueError(f"Rule {self.name} has no cooldown and no cap")
+        return self
+
+    def matches(self, item_id: str) -> bool:
+        if item_id in self.ids:
+            return True
+        base, sep, variant = item_id.rpartition("-v")
+        family = base if sep and variant.isdigit() else item_id
+        return family in self.families
+
+
+class _RuleState:
+    __slots__ = (
+        "rule", "members", "cap", "capped", "until_request", "until_time",
+        "deadline_request", "deadline_time",
+    )
+
+    def __init__(self, rule: SelectionRule, members: Tuple[int, ...], window_size: int):
+        self.rule = rule
+        self.members = members
+        self.cap = None if rule.max_share is None else rule.max_share * window_size
+        self.capped = False
+        # Active cooldown deadlines (None once expired)
+        self.until_request: Optional[int] = None
+        self.until_time: Optional[float] = None
+        # Latest deadlines ever set; kept after expiry so that a request with
+        # a stale (lower) index or clock cannot record inside the cooldown
+        self.deadline_request: Optional[int] = None
+        self.deadline_time: Optional[float] = None
+
+
+class RuleEngine:
+    def __init__(self, window_size: int):
+        self.window = RollingWindow(window_size)
+        self._states: List[_RuleState] = []
+        self._rules_of: Dict[int, Tuple[int, ...]] = {}
+        self._lock = threading.Lock()
+        # code -> number of active rule blocks on it, and its published snapshot
+        self._block_counts: Counter = Counter()
+        self._blocked: FrozenSet[int] = frozenset()
+        self._governed: FrozenSet[int] = frozenset()
+        # Pending expiries (heap of (deadline, rule index)); stale entries are skipped
+        self._request_expiries: List[Tuple[int, int]] = []
+        self._time_expiries: List[Tuple[float, int]] = []
+
+    @property
+    def blocked(self) -> FrozenSet[int]:
+        """Codes currently excluded by at least one rule."""
+        return self._blocked
+
+    @property
+    def governed(self) -> FrozenSet[int]:
+        """Codes targeted by any rule, whether or not they are blocked right now."""
+        return self._governed
+
+    def load(self, rules: Iterable[SelectionRule], items: Iterable[Tuple[Optional[str], int]]) -> None:
+        """Resolves rules against (id, code) pairs and resets all rule state."""
+        items = [(item_id, code) for item_id, code in items if item_id]
+        with self._lock:
+            self._states = []
+            self._rules_of = {}
+            self._block_counts = Counter()
+            self._request_expiries = []
+            self._time_expiries = []
+
+            for index, rule in enumerate(rules):
+                members = tuple(code for item_id, code in items if rule.matches(item_id))
+                state = _RuleState(rule, members, self.window.size)
+                self._states.append(state)
+                for code in members:
+                    self._rules_of[code] = self._rules_of.get(code, ()) + (index,)
+                if state.cap is not None:
+                    self.window.add_category(rule.name, members)
+                    self._update_cap(index)
+            self._governed = frozenset(self._rules_of)
+            self._publish()
+
+    def expire(self, request_index: int, now: float) -> None:
+        """Lifts cooldowns whose deadline has passed."""
+        if not self._due(request_index, now):
+            return
+        with self._lock:
+            self._expire(request_index, now)
+            self._publish()
+
+    def record(self, code: int, request_index: int, now: float, force: bool = False) -> bool:
+        """
+        Adds a selection to the window and applies the rules it triggers.
+        Returns False, recording nothing, if the rules exclude `code` by now
+        (unless `force`), e.g. when a concurrent request recorded it first.
+        """
+        with self._lock:
+            if not force and self._excluded(code, request_index, now):
+                return False
+            self._record(code, request_index, now)
+            self._publish()
+            return True
+
+    def _excluded(self, code: int, request_index: int, now: float) -> bool:
+        if code in self._block_counts:
+            return True
+        for index in self._rules_of.get(code, ()):
+            state = self._states[index]
+            if state.deadline_request is not None and request_index < state.deadline_request:
+                return True
+            if state.deadline_time is not None and now < state.deadline_time:
+                return True
+        return False
+
+    def _due(self, request_index: int, now: float) -> bool:
+        # Lock-free peek; a stale read only delays the expiry to the next call
+        requests, times = self._request_expiries, self._time_expiries
+        try:
+            return bool(
+                (requests and requests[0][0] <= request_index)
+                or (times and times[0][0] <= now)
+            )
+        except IndexError:  # Emptied concurrently; let the locked path decide
+            return True
+
+    def _expire(self, request_index: int, now: float) -> None:
+        while self._request_expiries and self._request_expiries[0][0] <= request_index:
+            _, index = heapq.heappop(self._request_expiries)
+            state = self._states[index]
+            if state.until_request is not None and state.until_request <= request_index:
+                state.until_request = None
+                if state.until_time is None:
+                    self._unblock(state)
+
+        while self._time_expiries and self._time_expiries[0][0] <= now:
+            _, index = heapq.heappop(self._time_expiries)
+            state = self._states[index]
+            if state.until_time is not None and state.until_time <= now:
+                state.until_time = None
+                if state.until_request is None:
+                    self._unblock(state)
+
+    def _record(self, code: int, request_index: int, now: float) -> None:
+        evicted = self.window.append(code)
+
+        for index in self._rules_of.get(code, ()):
+            state = self._states[index]
+            if state.rule.cooldown_requests is not None or state.rule.cooldown_seconds is not None:
+                self._start_cooldown(index, request_index, now)
+            self._update_cap(index)
+
+        if evicted != EMPTY_SLOT:
+            for index in self._rules_of.get(evicted, ()):
+                self._update_cap(index)
+
+    def _start_cooldown(self, index: int, request_index: int, now: float) -> None:
+        state = self._states[index]
+        was_cooling = state.until_request is not None or state.until_time is not None
+        # Deadlines never move backwards: a request with a lower index (or an
+        # earlier clock reading) may record after a higher one
+        if state.rule.cooldown_requests is not None:
+            deadline = request_index + state.rule.cooldown_requests
+            if state.deadline_request is None or deadline > state.deadline_request:
+                state.deadline_request = deadline
+                heapq.heappush(self._request_expiries, (deadline, index))
+            state.until_request = state.deadline_request
+        if state.rule.cooldown_seconds is not None:
+            deadline = now + state.rule.cooldown_seconds
+            if state.deadline_time is None or deadline > state.deadline_time:
+                state.deadline_time = deadline
+                heapq.heappush(self._time_expiries, (deadline, index))
+            state.until_time = state.deadline_time
+        if not was_cooling:
+            self._block(state)
+
+    def _update_cap(self, index: int) -> None:
+        state = self._states[index]
+        if state.cap is None:
+            return
+        reached = self.window.count(state.rule.name) >= state.cap
+        if reached and not state.capped:
+            state.capped = True
+            self._block(state)
+        elif not reached and state.capped:
+            state.capped = False
+            self._unblock(state)
+
+    def _block(self, state: _RuleState) -> None:
+        for code in state.members:
+            self._block_counts[code] += 1
+
+    def _unblock(self, state: _RuleState) -> None:
+        for code in state.members:
+            self._block_counts[code] -= 1
+            if self._block_counts[code] <= 0:
+                del self._block_counts[code]
+
+    def _publish(self) -> None:
+        if self._blocked.symmetric_difference(self._block_counts.keys()):
+            self._blocked = frozenset(self._block_counts)
@@ -0,0 +1,27 @@
+"""Per-key locking over a fixed pool of locks.
+
+Usage:
+
+    from app.libs.sharded_lock import ShardedLock
+
+    client_locks = ShardedLock(64)
+    with client_locks.lock_for(client_ip):
+        ...  # read-modify-write of this client's state
+
+Requests for different keys almost always take different locks, so they run
+without contending on a single global lock, while updates for the same key
+are serialized.
+"""
+
+import threading
+from typing import Hashable, List
+
+
+class ShardedLock:
+    def __init__(self, shards: int = 64):
+        if shards <= 0:
+            raise ValueError(f"Shard count must be positive, got {shards}")
+        self._locks: List[threading.Lock] = [threading.Lock() for _ in range(shards)]
+
+    def lock_for(self, key: Hashable) -> threading.Lock:
+        return self._locks[hash(key) % len(self._locks)]
@@ -0,0 +1,96 @@
+"""Auth benchmark: authentication cost per request, with and without the verified-token cache.
+
+Usage:
+
+    python auth_bench.py                    # 2000 requests per case
+    python auth_bench.py --requests 20000 --runs 5
+
+Signs a token with a throwaway key set (a temporary JWKS file, the same one
+cold_start_bench.py uses) and authenticates it repeatedly, in-process:
+
+- verify: what every request paid before the cache. The cache is cleared
+  before each call, so authorize_token looks up the signing key, checks the
+  RS256 signature and claims, and builds the User every time,
+- cached: authorize_token for a token verified before, which is what a
+  client presenting the same ID token until it expires pays,
+- middleware: authenticate() on a request scope with that token, i.e. the
+  cached path plus reading the header, as AuthMiddleware runs it.
+
+Each case reports the median per request over --runs runs.
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Callable
+
+from cold_start_bench import PROJECT_ID, make_key_set
+from databutton_app.mw.auth_mw import (
+    AuthConfig,
+    authenticate,
+    authorize_token,
+    verified_tokens,
+)
+from databutton_app.mw.jwks import get_jwks_cache
+
+
+def per_request_us(run: Callable[[int], None], requests: int, runs: int) -> float:
+    """Median time per request of run(requests), which makes that many requests."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run(requests)
+        times.append((time.perf_counter() - start) / requests * 1e6)
+    return statistics.median(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        jwks_path, token = make_key_set(directory)
+        auth_config = AuthConfig(jwks_url=jwks_path, audience=PROJECT_ID, header="authorization")
+        get_jwks_cache(jwks_path).refresh()  # Keys are prefetched at startup in the app
+
+        def verify(requests: int) -> None:
+            for _ in range(requests):
+                verified_tokens.clear()
+                assert authorize_token(token, auth_config) is not None
+
+        def cached(requests: int) -> None:
+            for _ in range(requests):
+                assert authorize_token(token, auth_config) is not None
+
+        scope = {
+            "type": "http",
+            "app": SimpleNamespace(state=SimpleNamespace(auth_config=auth_config)),
+            "headers": [(b"authorization", b"Bearer " + token.encode())],
+        }
+
+        async def authenticate_many(requests: int) -> None:
+            for _ in range(requests):
+                assert await authenticate(scope) is not None
+
+        def middleware(requests: int) -> None:
+            asyncio.run(authenticate_many(requests))
+
+        results = {}
+        for name, run in (("verify", verify), ("cached", cached), ("middleware", middleware)):
+            run(1)  # Warm up: imports, key lookup, first cache entry
+            results[name] = per_request_us(run, args.requests, args.runs)
+
+    for name, us in results.items():
+        print(
+            f"{name:10s} {us:9.1f} us/request  {1e6 / us:9.0f} requests/s"
+            f"  ({results['verify'] / us:.0f}x verify)"
+        )
+
+
+if __name__ == "__main__":
+    main()
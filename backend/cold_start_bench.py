@@ -0,0 +1,183 @@
+"""Cold start benchmark: process start to the first successful /jaas response.
+
+Usage:
+
+    python cold_start_bench.py              # uvicorn, eager and lazy startup, 5 runs each
+    python cold_start_bench.py --runs 10
+    python cold_start_bench.py --asgi       # no server: import main and call the app in-process
+
+Every run starts a fresh process with auth configured against a throwaway key
+set (a temporary JWKS file, see AUTH_JWKS_URL in main.py) and requests
+GET /routes/jaas with a token signed by it, retrying until it gets a 200. The
+time is taken from just before the process is spawned until that response
+arrives. Each run also reports the app's startup phases (app.state.startup_timings).
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ID = "cold-start-bench"
+
+# Runs in the child for --asgi: import the app, then send one request to it
+ASGI_CHILD = """
+import asyncio, json, sys
+import main
+
+async def get(path, token):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "client": ("127.0.0.1", 1), "server": ("bench", 80),
+        "headers": [(b"host", b"bench"), (b"authorization", b"Bearer " + token.encode())],
+    }
+    status = []
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+    await main.app(scope, receive, send)
+    return status[0]
+
+status = asyncio.run(get("/routes/jaas", sys.argv[1]))
+print("BENCH " + json.dumps({"status": status, "phases": main.app.state.startup_timings}), flush=True)
+"""
+
+
+def make_key_set(directory: str) -> tuple[str, str]:
+    """Writes a JWKS file and returns (its path, a token signed for it)."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(RSAAlgorithm.to_jwk(key.public_key()))
+    jwk.update(kid="bench", alg="RS256", use="sig")
+    path = os.path.join(directory, "jwks.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"keys": [jwk]}, f)
+
+    now = int(time.time())
+    token = jwt.encode(
+        {"sub": "bench", "aud": PROJECT_ID, "iat": now, "exp": now + 3600},
+        key,
+        algorithm="RS256",
+        headers={"kid": "bench"},
+    )
+    return path, token
+
+
+def child_env(jwks_path: str, lazy: bool) -> dict:
+    env = dict(os.environ)
+    env.update(
+        DATABUTTON_EXTENSIONS=json.dumps(
+            [{"name": "firebase-auth", "config": {"firebaseConfig": {"projectId": PROJECT_ID}}}]
+        ),
+        AUTH_JWKS_URL=jwks_path,
+        DATABUTTON_LAZY_STARTUP="1" if lazy else "0",
+    )
+    return env
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_asgi(env: dict, token: str) -> tuple[float, dict]:
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", ASGI_CHILD, token],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    elapsed = time.perf_counter() - start
+    for line in result.stdout.splitlines():
+        if line.startswith("BENCH "):
+            report = json.loads(line[len("BENCH "):])
+            if report["status"] != 200:
+                raise RuntimeError(f"/routes/jaas returned {report['status']}")
+            # Includes interpreter shutdown; fine for comparing startup modes
+            return elapsed, report["phases"]
+    raise RuntimeError(f"No result from child:\n{result.stderr}")
+
+
+def run_uvicorn(env: dict, token: str) -> tuple[float, dict]:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/routes/jaas"
+    request = urllib.request.Request(url, headers={"Authorization": f"Bearer {token}"})
+
+    with tempfile.TemporaryFile("w+") as out:
+        start = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env, stdout=out, stderr=subprocess.STDOUT, text=True,
+        )
+        try:
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"Server exited with {server.returncode}")
+                try:
+                    with urllib.request.urlopen(request, timeout=5) as response:
+                        if response.status == 200:
+                            break
+                except (urllib.error.URLError, ConnectionError):
+                    time.sleep(0.002)
+            elapsed = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+
+        out.seek(0)
+        for line in out:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if "phases" in entry:
+                return elapsed, entry["phases"]
+    return elapsed, {}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--asgi", action="store_true", help="call the app in-process instead of over http")
+    args = parser.parse_args()
+    run = run_asgi if args.asgi else run_uvicorn
+
+    with tempfile.TemporaryDirectory() as directory:
+        jwks_path, token = make_key_set(directory)
+
+        for lazy in (False, True):
+            env = child_env(jwks_path, lazy)
+            run(env, token)  # Warm the OS file cache and bytecode, not measured
+
+            times, phases = [], []
+            for _ in range(args.runs):
+                elapsed, timings = run(env, token)
+                times.append(elapsed * 1000)
+                phases.append(timings)
+
+            mode = "lazy " if lazy else "eager"
+            print(
+                f"{mode}  first /jaas after {statistics.median(times):7.1f} ms median"
+                f"  (min {min(times):.1f}, max {max(times):.1f}, {args.runs} runs)"
+            )
+            for name in phases[0]:
+                values = [p[name] for p in phases if name in p]
+                print(f"         {name:12s} {statistics.median(values):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Structured JSON logging that never blocks the caller.
+
+Usage:
+
+    from databutton_app.logs import get_logger, setup_logging
+
+    setup_logging()  # once, at startup; idempotent
+    log = get_logger(__name__)
+
+    log.info("User %s authenticated", user.sub)
+    log.info("Missing header %r", name, extra={"sample": 0.1})  # keep ~10%
+    log.warning("Fetch failed", extra={"source": url})  # extra keys become JSON fields
+
+Logging calls only filter the record and put it on a bounded queue; a
+background thread formats it as one JSON object per line and writes it. When
+the queue is full the record is dropped (and counted) rather than waiting.
+
+Noisy messages are limited per message template (the unformatted msg, so use
+%-style arguments, not f-strings): at most RATE_LIMIT_PER_MESSAGE records per
+RATE_LIMIT_PERIOD, with the number suppressed reported on the next one that
+gets through. A record with a `sample` rate in `extra` is kept with that
+probability.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Dict, Optional, TextIO, Tuple
+
+QUEUE_SIZE = 10_000
+RATE_LIMIT_PER_MESSAGE = 20
+RATE_LIMIT_PERIOD = 1.0  # seconds
+MAX_TRACKED_MESSAGES = 1_000
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRS = frozenset(
+    logging.LogRecord("", 0, "", 0, "", None, None).__dict__
+) | {"message", "asctime", "sample"}
+
+
+_exception_formatter = logging.Formatter()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with `extra` fields at the top level."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a record with probability `record.sample` (from extra), if set."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        sample = getattr(record, "sample", None)
+        return sample is None or random.random() < sample
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets through at most `limit` records per message template per `period`."""
+
+    def __init__(self, limit: int = RATE_LIMIT_PER_MESSAGE, period: float = RATE_LIMIT_PERIOD):
+        super().__init__()
+        self.limit = limit
+        self.period = period
+        self._lock = threading.Lock()
+        # (logger, template) -> [window start, count, suppressed]
+        self._windows: Dict[Tuple[str, object], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                if len(self._windows) >= MAX_TRACKED_MESSAGES:
+                    self._windows.clear()
+                window = self._windows[key] = [now, 0, 0]
+            elif now - window[0] >= self.period:
+                window[0] = now
+                window[1] = 0
+
+            if window[1] >= self.limit:
+                window[2] += 1
+                return False
+            window[1] += 1
+            suppressed, window[2] = window[2], 0
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """A QueueHandler that drops records when the queue is full instead of erroring."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments now (they may change later), but leave the JSON
+        # formatting to the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.dropped:
+            record.dropped, self.dropped = self.dropped, 0
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1 + getattr(record, "dropped", 0)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(level: Optional[str] = None, stream: TextIO = sys.stdout) -> None:
+    """
+    Routes the root logger through the queue to a JSON writer thread. The
+    level defaults to $LOG_LEVEL, or INFO.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        writer = logging.StreamHandler(stream)
+        writer.setFormatter(JsonFormatter())
+
+        log_queue: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+        handler = DroppingQueueHandler(log_queue)
+        # Filters run in the caller's thread, so dropped records cost no copy
+        handler.addFilter(SamplingFilter())
+        handler.addFilter(RateLimitFilter())
+
+        root = logging.getLogger()
+        root.addHandler(handler)
+        root.setLevel(level or os.environ.get("LOG_LEVEL", "INFO").upper())
+
+        _listener = logging.handlers.QueueListener(log_queue, writer)
+        _listener.start()
+        # Write out what is still queued on exit
+        atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
@@ -1,12 +1,25 @@
-import functools
+import hashlib
+import json
+import time
 from http import HTTPStatus
-from typing import Annotated, Callable
-import jwt
+from typing import Annotated, Callable, Iterable
 from fastapi import Depends, HTTPException, WebSocket, WebSocketException, status
 from fastapi.requests import HTTPConnection
-from jwt import PyJWKClient
 from pydantic import BaseModel
-from starlette.requests import Request
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import compile_path
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from shared.lru_store import LruTtlStore
+from databutton_app.logs import get_logger
+from databutton_app.mw.jwks import get_jwks_cache
+from databutton_app.mw.route_path import route_path
+
+log = get_logger(__name__)
+
+# Fraction of routine messages (successful logins, requests without a token)
+# that are logged; failures are always logged, subject to rate limiting
+AUTH_LOG_SAMPLE = 0.1
 
 
 class AuthConfig(BaseModel):
@@ -46,24 +59,25 @@ def get_audit_log(request: HTTPConnection) -> Callable[[str], None] | None:
 AuditLogDep = Annotated[Callable[[str], None] | None, Depends(get_audit_log)]
 
 
-def get_authorized_user(
+# Scope state key for the User the AuthMiddleware authenticated (request.state.user)
+AUTH_USER = "user"
+
+
+async def get_authorized_user(
     request: HTTPConnection,
 ) -> User:
-    auth_config = get_auth_config(request)
+    """
+    The authenticated user. Reads what the AuthMiddleware stored, so depending
+    on it costs nothing; without the middleware it authenticates here.
+    """
+    user = request.scope.get("state", {}).get(AUTH_USER)
+    if user is not None:
+        return user
 
-    try:
-        if isinstance(request, WebSocket):
-            user = authorize_websocket(request, auth_config)
-        elif isinstance(request, Request):
-            user = authorize_request(request, auth_config)
-        else:
-            raise ValueError("Unexpected request type")
-
-        if user is not None:
-            return user
-        print("Request authentication returned no user")
-    except Exception as e:
-        print(f"Request authentication failed: {e}")
+    get_auth_config(request)
+    user = await authenticate(request.scope)
+    if user is not None:
+        return user
 
     if isinstance(request, WebSocket):
         raise WebSocketException(
@@ -75,15 +89,124 @@ def get_authorized_user(
         )
 
 
-@functools.cache
-def get_jwks_client(url: str):
-    """Reuse client cached by its url, client caches keys by default."""
-    return PyJWKClient(url, cache_keys=True)
+async def authenticate(scope: Scope) -> User | None:
+    """Authenticates a request or websocket handshake from its headers."""
+    auth_config: AuthConfig | None = getattr(scope["app"].state, "auth_config", None)
+    if auth_config is None:
+        return None
+
+    connection = HTTPConnection(scope)
+    if scope["type"] == "websocket":
+        token = get_websocket_token(connection)
+    else:
+        token = get_request_token(connection, auth_config)
+    if not token:
+        return None
+
+    user = get_cached_user(token, auth_config)
+    if user is not None:
+        return user
+
+    # Checking a new token's signature (and maybe fetching keys) blocks, so it
+    # runs in the threadpool; repeats of the same token are served above
+    try:
+        user = await run_in_threadpool(authorize_token, token, auth_config)
+    except Exception as e:
+        log.warning("Request authentication failed: %s", e)
+        return None
+    if user is None:
+        log.info("Request authentication returned no user")
+    return user
+
+
+class PathTable:
+    """A set of route paths, compiled once. Paths may have {parameters}."""
+
+    def __init__(self, paths: Iterable[str] = ()):
+        self.exact: frozenset[str] = frozenset()
+        self.patterns: tuple = ()
+        self.add(paths)
+
+    def add(self, paths: Iterable[str]) -> None:
+        """Adds paths, e.g. for routers loaded after startup. Readers never lock."""
+        exact = set(self.exact)
+        patterns = list(self.patterns)
+        for path in paths:
+            if "{" in path:
+                patterns.append(compile_path(path)[0])
+            else:
+                exact.add(path)
+        self.exact = frozenset(exact)
+        self.patterns = tuple(patterns)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.exact or any(p.match(path) for p in self.patterns)
+
+
+class AuthMiddleware:
+    """
+    Pure ASGI authentication for every path under `prefix` except the public
+    ones. Runs once per request, or once per websocket connection (on the
+    handshake), and stores the User in scope state for handlers.
+    """
+
+    def __init__(self, app: ASGIApp, public_paths: PathTable, prefix: str = "/routes"):
+        self.app = app
+        self.public_paths = public_paths
+        self.prefix = prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        # Match what the router will match, or a root_path would skip auth
+        path = route_path(scope)
+        if not path.startswith(self.prefix) or path in self.public_paths:
+            await self.app(scope, receive, send)
+            return
+
+        user = await authenticate(scope)
+        if user is None:
+            await self._reject(scope, send)
+            return
+
+        scope.setdefault("state", {})[AUTH_USER] = user
+        await self.app(scope, receive, send)
+
+    async def _reject(self, scope: Scope, send: Send) -> None:
+        has_config = getattr(scope["app"].state, "auth_config", None) is not None
+        detail = "Not authenticated" if has_config else "No auth config"
+
+        if scope["type"] == "websocket":
+            await send({
+                "type": "websocket.close",
+                "code": status.WS_1008_POLICY_VIOLATION,
+                "reason": detail,
+            })
+            return
+
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        raw_headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+        ]
+        await send({"type": "http.response.start", "status": 401, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+# jwt (and cryptography behind it) is imported on first use, so apps without an
+# auth config never load it; see also jwks.py
 
 
 def get_signing_key(url: str, token: str) -> tuple[str, str]:
-    client = get_jwks_client(url)
-    signing_key = client.get_signing_key_from_jwt(token)
+    import jwt
+
+    kid = jwt.get_unverified_header(token).get("kid")
+    if not kid:
+        raise ValueError("Token header has no key id")
+    # Keys are prefetched and refreshed in the background, see jwks.py
+    signing_key = get_jwks_cache(url).get_signing_key(kid)
     key = signing_key.key
     alg = signing_key.algorithm_name
     if alg != "RS256":
@@ -91,53 +214,138 @@ def get_signing_key(url: str, token: str) -> tuple[str, str]:
     return (key, alg)
 
 
-def authorize_websocket(
-    request: WebSocket,
-    auth_config: AuthConfig,
-) -> User | None:
-    # Parse Sec-Websocket-Protocol
-    header = "Sec-Websocket-Protocol"
-    sep = ","
-    prefix = "Authorization.Bearer."
-    protocols_header = request.headers.get(header)
-    protocols = (
-        [h.strip() for h in protocols_header.split(sep)] if protocols_header else []
+# Browsers cannot set headers on websockets, so the token is sent as a subprotocol
+WEBSOCKET_PROTOCOL_HEADER = "Sec-Websocket-Protocol"
+WEBSOCKET_BEARER_PREFIX = "Authorization.Bearer."
+
+
+def get_websocket_protocols(request: HTTPConnection) -> list[str]:
+    protocols_header = request.headers.get(WEBSOCKET_PROTOCOL_HEADER)
+    return (
+        [h.strip() for h in protocols_header.split(",")] if protocols_header else []
     )
 
-    token: str | None = None
+
+def select_websocket_subprotocol(request: HTTPConnection) -> str | None:
+    """
+    The subprotocol to accept with. Browsers drop the connection unless the
+    server picks one of the offered protocols, so prefer a real one and only
+    echo the bearer protocol when it is all the client sent.
+    """
+    protocols = get_websocket_protocols(request)
     for p in protocols:
-        if p.startswith(prefix):
-            token = p.removeprefix(prefix)
-            break
+        if not p.startswith(WEBSOCKET_BEARER_PREFIX):
+            return p
+    return protocols[0] if protocols else None
 
-    if not token:
-        print(f"Missing bearer {prefix}.<token> in protocols")
-        return None
 
-    return authorize_token(token, auth_config)
+def get_websocket_token(request: HTTPConnection) -> str | None:
+    # Parse Sec-Websocket-Protocol
+    prefix = WEBSOCKET_BEARER_PREFIX
+    for p in get_websocket_protocols(request):
+        if p.startswith(prefix):
+            return p.removeprefix(prefix) or None
 
+    log.info("Missing bearer %s<token> in protocols", prefix, extra={"sample": AUTH_LOG_SAMPLE})
+    return None
 
-def authorize_request(
-    request: Request,
+
+def get_request_token(
+    request: HTTPConnection,
     auth_config: AuthConfig,
-) -> User | None:
+) -> str | None:
     auth_header = request.headers.get(auth_config.header)
     if not auth_header:
-        print(f"Missing header '{auth_config.header}'")
+        log.info("Missing header %r", auth_config.header, extra={"sample": AUTH_LOG_SAMPLE})
         return None
 
     token = auth_header.startswith("Bearer ") and auth_header[7:]
     if not token:
-        print(f"Missing bearer token in '{auth_config.header}'")
+        log.info("Missing bearer token in %r", auth_config.header, extra={"sample": AUTH_LOG_SAMPLE})
         return None
+    return token
+
+
+def authorize_websocket(
+    request: HTTPConnection,
+    auth_config: AuthConfig,
+) -> User | None:
+    token = get_websocket_token(request)
+    return authorize_token(token, auth_config) if token else None
+
+
+def authorize_request(
+    request: HTTPConnection,
+    auth_config: AuthConfig,
+) -> User | None:
+    token = get_request_token(request, auth_config)
+    return authorize_token(token, auth_config) if token else None
+
+
+# Verified tokens: (token digest, audience, jwks url) -> (exp, User). Clients
+# present the same ID token on every request until it expires (an hour for
+# Firebase), so repeats skip key lookup, signature check and payload parsing.
+VERIFIED_TOKEN_CACHE_SIZE = 10_000
+VERIFIED_TOKEN_TTL = 60 * 60  # seconds idle; entries never outlive their exp
+verified_tokens: LruTtlStore[tuple[float, User]] = LruTtlStore(
+    max_entries=VERIFIED_TOKEN_CACHE_SIZE, ttl=VERIFIED_TOKEN_TTL, entry_bytes=512
+)
+
+
+def token_cache_key(token: str, auth_config: AuthConfig) -> tuple[bytes, str, str]:
+    return (
+        hashlib.sha256(token.encode("utf-8")).digest(),
+        auth_config.audience,
+        auth_config.jwks_url,
+    )
+
 
-    return authorize_token(token, auth_config)
+def get_cached_user(token: str, auth_config: AuthConfig) -> User | None:
+    """The user for a token verified before and not yet expired, or None."""
+    cache_key = token_cache_key(token, auth_config)
+    cached = verified_tokens.get(cache_key)
+    if cached is not None:
+        exp, user = cached
+        if time.time() < exp:
+            return user
+        verified_tokens.pop(cache_key)
+    return None
 
 
 def authorize_token(
     token: str,
     auth_config: AuthConfig,
 ) -> User | None:
+    user = get_cached_user(token, auth_config)
+    if user is not None:
+        return user
+
+    cache_key = token_cache_key(token, auth_config)
+    payload = verify_token(token, auth_config)
+    if payload is None:
+        return None  # verify_token logged why
+
+    try:
+        user = User.model_validate(payload)
+        log.info("User %s authenticated", user.sub, extra={"sample": AUTH_LOG_SAMPLE})
+    except Exception as e:
+        log.warning("Failed to parse token payload: %s", e)
+        return None
+
+    # jwt.decode has checked exp if present; tokens without one are not cached
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        verified_tokens[cache_key] = (exp, user)
+    return user
+
+
+def verify_token(
+    token: str,
+    auth_config: AuthConfig,
+) -> dict | None:
+    """Verifies the signature and claims. Returns the payload, or None."""
+    import jwt
+
     # Audience and jwks url to get signing key from based on the users config
     jwks_urls = [(auth_config.audience, auth_config.jwks_url)]
 
@@ -146,7 +354,7 @@ def authorize_token(
         try:
             key, alg = get_signing_key(jwks_url, token)
         except Exception as e:
-            print(f"Failed to get signing key {e}")
+            log.warning("Failed to get signing key: %s", e)
             continue
 
         try:
@@ -157,13 +365,7 @@ def authorize_token(
                 audience=audience,
             )
         except jwt.PyJWTError as e:
-            print(f"Failed to decode and validate token {e}")
+            log.warning("Failed to decode and validate token: %s", e)
             continue
 
-    try:
-        user = User.model_validate(payload)
-        print(f"User {user.sub} authenticated")
-        return user
-    except Exception as e:
-        print(f"Failed to parse token payload {e}")
-        return None
+    return payload
@@ -0,0 +1,161 @@
+"""JWKS signing keys with prefetch, background refresh and negative caching.
+
+Usage:
+
+    from databutton_app.mw.jwks import get_jwks_cache
+
+    jwks = get_jwks_cache(auth_config.jwks_url)  # http(s)://, file:// or a path
+    jwks.start()                                 # prefetch + refresh in the background
+    key = jwks.get_signing_key(kid)              # KeyError if the kid is unknown
+
+Requests normally find their key in memory: keys are fetched when the app
+starts and refreshed periodically by a daemon thread. An unknown kid (e.g.
+after a key rotation) triggers a refetch, but at most one per
+MIN_REFETCH_INTERVAL across all kids, and a kid that is still unknown after
+a fetch that started once it arrived is remembered for NEGATIVE_TTL. Misses
+inside the refetch interval are rejected without waiting on a fetch. A burst of tokens with made-up kids therefore
+costs a dictionary lookup each, not a fetch each.
+
+A file:// URL or plain path reads the key set from disk, and any http URL can
+point at a stand-in server, for tests and air-gapped runs.
+"""
+
+import functools
+import json
+import re
+import threading
+import time
+import urllib.request
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+from shared.lru_store import LruTtlStore
+from databutton_app.logs import get_logger
+
+if TYPE_CHECKING:
+    import jwt
+
+log = get_logger(__name__)
+
+REFRESH_INTERVAL = 60 * 60  # seconds; shortened by the response's max-age
+MIN_REFETCH_INTERVAL = 30.0  # seconds between fetches triggered by unknown kids
+NEGATIVE_TTL = 5 * 60  # seconds an unknown kid is rejected without a fetch
+MAX_UNKNOWN_KIDS = 10_000
+FETCH_TIMEOUT = 5.0
+
+_MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+class JwksCache:
+    def __init__(self, source: str):
+        self.source = source
+        self._keys: Dict[str, "jwt.PyJWK"] = {}
+        self._unknown: LruTtlStore[bool] = LruTtlStore(
+            max_entries=MAX_UNKNOWN_KIDS, ttl=NEGATIVE_TTL, entry_bytes=128
+        )
+        # Serializes fetches, so concurrent misses share one fetch
+        self._fetch_lock = threading.Lock()
+        self._last_fetch = float("-inf")  # When the last fetch started
+        self._last_fetch_ok = False
+        self._loaded = False  # Whether any fetch has succeeded yet
+        self._max_age: Optional[float] = None
+        self._refresher: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def get_signing_key(self, kid: str) -> "jwt.PyJWK":
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+        if kid in self._unknown:
+            raise KeyError(f"Unknown signing key {kid!r}")
+
+        arrived = time.monotonic()
+        # Throttled misses are rejected without waiting for the lock, which a
+        # refresh holds for its network I/O. Until keys first load, wait for
+        # the prefetch instead, or every token would fail at startup.
+        if self._loaded and arrived - self._last_fetch < MIN_REFETCH_INTERVAL:
+            raise KeyError(f"Unknown signing key {kid!r}")
+
+        with self._fetch_lock:
+            # Another request may have fetched while we waited
+            key = self._keys.get(kid)
+            if key is None and time.monotonic() - self._last_fetch >= MIN_REFETCH_INTERVAL:
+                self._fetch()
+                key = self._keys.get(kid)
+            # Only remember a miss if a successful fetch started after it
+            # arrived, so a kid published since the last fetch is not blocked
+            checked = key is None and self._last_fetch_ok and self._last_fetch >= arrived
+
+        if key is None:
+            if checked:
+                self._unknown[kid] = True
+            raise KeyError(f"Unknown signing key {kid!r}")
+        return key
+
+    def refresh(self) -> bool:
+        """Fetches the key set now. Returns False (keeping the old keys) on failure."""
+        with self._fetch_lock:
+            return self._fetch()
+
+    def start(self) -> None:
+        """Prefetches and keeps refreshing in a daemon thread. Idempotent."""
+        with self._start_lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(
+                    target=self._refresh_loop, name="jwks-refresh", daemon=True
+                )
+                self._refresher.start()
+
+    def _refresh_loop(self) -> None:
+        while True:
+            ok = self.refresh()
+            if ok:
+                interval = min(self._max_age or REFRESH_INTERVAL, REFRESH_INTERVAL)
+            else:
+                interval = MIN_REFETCH_INTERVAL  # Retry soon, keys may be missing
+            time.sleep(max(interval, MIN_REFETCH_INTERVAL))
+
+    def _fetch(self) -> bool:
+        # Imported here so it loads on the refresh thread, off the startup path
+        import jwt
+
+        self._last_fetch = time.monotonic()
+        try:
+            key_set, max_age = self._load()
+        except Exception as e:
+            log.warning("Failed to fetch JWKS from %s: %s", self.source, e)
+            self._last_fetch_ok = False
+            return False
+
+        keys: Dict[str, "jwt.PyJWK"] = {}
+        for jwk in key_set.get("keys", []):
+            try:
+                key = jwt.PyJWK.from_dict(jwk)
+            except jwt.PyJWTError as e:
+                log.warning("Skipping unusable JWKS key %s: %s", jwk.get("kid"), e)
+                continue
+            if key.key_id:
+                keys[key.key_id] = key
+
+        self._keys = keys
+        self._max_age = max_age
+        self._last_fetch_ok = True
+        self._loaded = True
+        for kid in keys:
+            self._unknown.pop(kid)
+        return True
+
+    def _load(self) -> Tuple[dict, Optional[float]]:
+        if self.source.startswith(("http://", "https://")):
+            with urllib.request.urlopen(self.source, timeout=FETCH_TIMEOUT) as response:
+                match = _MAX_AGE_PATTERN.search(response.headers.get("Cache-Control", ""))
+                return json.load(response), float(match.group(1)) if match else None
+
+        path = self.source.removeprefix("file://")
+        with open(path, encoding="utf-8") as f:
+            return json.load(f), None
+
+
+@functools.cache
+def get_jwks_cache(source: str) -> JwksCache:
+    """One cache per JWKS source, shared by all requests."""
+    return JwksCache(source)
@@ -0,0 +1,42 @@
+import asyncio
+from typing import Awaitable, Callable, Iterable
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from databutton_app.mw.route_path import route_path
+
+
+class LazyLoadMiddleware:
+    """
+    Pure ASGI middleware that runs `load` once, when the first request under
+    one of `prefixes` arrives, and holds that request (and any arriving
+    meanwhile) until it is done. Other paths are served right away.
+
+    Used for lazy startup: the app starts serving before its API routers are
+    imported, and the first API request pays for the import instead.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        load: Callable[[], Awaitable[None]],
+        prefixes: Iterable[str] = ("/routes",),
+    ):
+        self.app = app
+        self.load = load
+        self.prefixes = tuple(prefixes)
+        self.loaded = False
+        self._lock = asyncio.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            not self.loaded
+            and scope["type"] in ("http", "websocket")
+            and route_path(scope).startswith(self.prefixes)
+        ):
+            async with self._lock:
+                if not self.loaded:
+                    await self.load()
+                    self.loaded = True
+
+        await self.app(scope, receive, send)
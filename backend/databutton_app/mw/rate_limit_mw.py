@@ -0,0 +1,246 @@
+import asyncio
+import json
+import math
+import threading
+import time
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from databutton_app.mw.route_path import route_path
+from shared.lru_store import LruTtlStore
+
+
+class RateLimit(BaseModel):
+    # Sustained rate: `requests` per `period` seconds
+    requests: int
+    period: float
+
+    # Bucket size, i.e. how many requests may arrive at once (default: requests)
+    burst: Optional[int] = None
+
+    # Routes with the same bucket name share one budget per client
+    bucket: Optional[str] = None
+
+    @property
+    def capacity(self) -> float:
+        return float(self.burst if self.burst is not None else self.requests)
+
+    @property
+    def refill_rate(self) -> float:
+        return self.requests / self.period
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+    def take(self, limit: RateLimit, cost: float, now: float) -> bool:
+        self.tokens = min(limit.capacity, self.tokens + (now - self.updated) * limit.refill_rate)
+        self.updated = now
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+    def headers(self, limit: RateLimit) -> Dict[str, str]:
+        rate = limit.refill_rate
+        return {
+            "RateLimit-Limit": str(limit.requests),
+            "RateLimit-Remaining": str(int(self.tokens)),
+            # Seconds until the bucket is full again
+            "RateLimit-Reset": str(math.ceil((limit.capacity - self.tokens) / rate)),
+        }
+
+    def retry_after(self, limit: RateLimit, cost: float) -> int:
+        return max(1, math.ceil((cost - self.tokens) / limit.refill_rate))
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, headers: Dict[str, str], retry_after: int):
+        self.headers = headers
+        self.retry_after = retry_after
+
+
+class ConnectionLimiter:
+    """Caps concurrent long-lived connections (e.g. websockets), overall and per client."""
+
+    def __init__(self, max_connections: int, max_per_client: int):
+        self.max_connections = max_connections
+        self.max_per_client = max_per_client
+        self._lock = threading.Lock()
+        self._total = 0
+        self._per_client: Dict[str, int] = {}
+
+    def acquire(self, client: str) -> bool:
+        with self._lock:
+            held = self._per_client.get(client, 0)
+            if self._total >= self.max_connections or held >= self.max_per_client:
+                return False
+            self._total += 1
+            self._per_client[client] = held + 1
+            return True
+
+    def release(self, client: str) -> None:
+        with self._lock:
+            held = self._per_client.get(client, 0)
+            if held == 0:
+                return
+            self._total -= 1
+            if held == 1:
+                del self._per_client[client]
+            else:
+                self._per_client[client] = held - 1
+
+    def __len__(self) -> int:
+        return self._total
+
+
+class RateLimiter:
+    """Token buckets per (bucket, client), bounded by an LruTtlStore."""
+
+    def __init__(self, limits: Dict[str, RateLimit], max_clients: int = 100_000):
+        self.limits = limits
+        # An idle bucket is full again after capacity / refill_rate seconds, so
+        # dropping it then and recreating it full later grants nothing extra
+        ttl = max((limit.capacity / limit.refill_rate for limit in limits.values()), default=60)
+        self.buckets: LruTtlStore[TokenBucket] = LruTtlStore(
+            max_entries=max_clients, ttl=ttl, entry_bytes=256
+        )
+
+    def limit_for(self, path: str) -> Optional[RateLimit]:
+        return self.limits.get(path)
+
+    def charge(self, path: str, client: str, cost: float = 1) -> Dict[str, str]:
+        """
+        Takes `cost` tokens for `client` on `path`. Returns the RateLimit-* headers,
+        or raises RateLimitExceeded (with Retry-After added) without taking any.
+        """
+        limit = self.limit_for(path)
+        if limit is None:
+            return {}
+
+        now = time.monotonic()
+        key = (limit.bucket or path, client)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(limit.capacity, now)
+
+        if not bucket.take(limit, cost, now):
+            retry_after = bucket.retry_after(limit, cost)
+            headers = bucket.headers(limit)
+            headers["Retry-After"] = str(retry_after)
+            raise RateLimitExceeded(headers, retry_after)
+        return bucket.headers(limit)
+
+
+# Scope state key for the RateLimit-* headers the middleware adds to the response
+RATE_LIMIT_HEADERS = "rate_limit_headers"
+
+
+def client_key(scope: Scope) -> str:
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def charge_rate_limit(request: HTTPConnection, cost: float) -> None:
+    """
+    Charges `cost` more tokens from inside a handler, e.g. one per extra item of
+    a batch request (the middleware already took one for the request itself).
+    """
+    limiter: Optional[RateLimiter] = getattr(request.app.state, "rate_limiter", None)
+    if limiter is None or cost <= 0:
+        return
+
+    path = route_path(request.scope)
+    limit = limiter.limit_for(path)
+    if limit is not None and cost + 1 > limit.capacity:
+        # Can never succeed, so not a 429: retrying would not help
+        raise HTTPException(
+            status_code=413,
+            detail=f"Request costs {int(cost + 1)} but the rate limit allows at most {int(limit.capacity)} at once.",
+        )
+
+    # The middleware reports the balance after this charge, if it is installed
+    reported: Optional[Dict[str, str]] = request.scope.get("state", {}).get(RATE_LIMIT_HEADERS)
+    try:
+        headers = limiter.charge(path, client_key(request.scope), cost)
+    except RateLimitExceeded as e:
+        if reported is not None:
+            reported.update(e.headers)
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded. Try again later.",
+            headers=None if reported is not None else e.headers,
+        )
+    if reported is not None:
+        reported.update(headers)
+
+
+async def wait_rate_limit(request: HTTPConnection, cost: float = 1) -> None:
+    """
+    Like charge_rate_limit, but waits until the tokens are available instead of
+    rejecting, e.g. to pace a long-lived stream to the client's rate limit.
+    """
+    limiter: Optional[RateLimiter] = getattr(request.app.state, "rate_limiter", None)
+    if limiter is None:
+        return
+
+    path, client = route_path(request.scope), client_key(request.scope)
+    while True:
+        try:
+            limiter.charge(path, client, cost)
+            return
+        except RateLimitExceeded as e:
+            await asyncio.sleep(e.retry_after)
+
+
+class RateLimitMiddleware:
+    """
+    Pure ASGI token-bucket rate limiter. It sits in front of routing and the
+    AuthMiddleware, so over-limit requests are rejected before auth runs.
+    """
+
+    def __init__(self, app: ASGIApp, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Limits are keyed by route path, which excludes any root_path
+        path = route_path(scope) if scope["type"] == "http" else ""
+        if self.limiter.limit_for(path) is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            headers = self.limiter.charge(path, client_key(scope))
+        except RateLimitExceeded as e:
+            await self._reject(send, e.headers)
+            return
+
+        # Handlers may charge more (see charge_rate_limit), so encode at response time
+        scope.setdefault("state", {})[RATE_LIMIT_HEADERS] = headers
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                raw_headers = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]
+                message["headers"] = [*message.get("headers", []), *raw_headers]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    async def _reject(self, send: Send, headers: Dict[str, str]) -> None:
+        body = json.dumps({"detail": "Rate limit exceeded. Try again later."}).encode("utf-8")
+        raw_headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            *((k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()),
+        ]
+        await send({"type": "http.response.start", "status": 429, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,20 @@
+from starlette.types import Scope
+
+
+def route_path(scope: Scope) -> str:
+    """
+    The path the app routes on: scope["path"] without the ASGI root_path.
+
+    Behind a path-prefix proxy (or `uvicorn --root-path /api`) scope["path"] is
+    "/api/routes/jaas" while Starlette routes "/routes/jaas", so middlewares
+    that match routes must strip the root_path the same way Starlette does.
+    """
+    path: str = scope["path"]
+    root_path: str = scope.get("root_path", "")
+    if not root_path or not path.startswith(root_path):
+        return path
+    if path == root_path:
+        return ""
+    if path[len(root_path)] == "/":
+        return path[len(root_path):]
+    return path
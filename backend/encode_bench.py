@@ -0,0 +1,93 @@
+"""Serialization benchmark: per-response cost of building a /jaas body, before and after pre-encoding.
+
+Usage:
+
+    python encode_bench.py                  # best of 5 x 50k responses per case
+    python encode_bench.py --responses 200000 --runs 3
+
+Times building one response object with its body, for a curated library
+entry, a rendered template and format=plain:
+
+- models: what the handlers did before. Build JustificationMeta and
+  JustificationResponse, then encode them the way FastAPI serializes a
+  returned model (jsonable_encoder, then JSONResponse). format=plain returned
+  the bare text, which went through the same path,
+- encoded: what they do now. Join the pre-encoded fragments (see
+  ResponseEncoder and encode_text) into an EncodedJSONResponse.
+
+Rendering the template is not timed. Since pre-encoding, rendering also
+encodes the rendered text (about a microsecond, see generate_from_template),
+which is therefore not timed either. Both paths must produce the same bytes;
+the benchmark checks that before timing.
+"""
+
+import argparse
+import time
+from typing import Callable
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.apis.jaas import SPEC, JustificationMeta, JustificationResponse
+from app.libs import engine
+from app.libs.engine import JustificationEntry, Topic
+from app.libs.http_cache import EncodedJSONResponse
+
+TOPIC = Topic.change_request
+
+
+def models_json(selected: JustificationEntry) -> JSONResponse:
+    response = JustificationResponse(
+        justification=selected.text,
+        topic=TOPIC,
+        tone=engine.TONES[selected.tone],
+        intensity=selected.intensity,
+        meta=JustificationMeta(id=selected.id, source=selected.source, safe_for_work=selected.safe_for_work),
+    )
+    return JSONResponse(jsonable_encoder(response))
+
+
+def models_plain(selected: JustificationEntry) -> JSONResponse:
+    return JSONResponse(jsonable_encoder(selected.text))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--responses", type=int, default=50_000)
+    parser.add_argument("--runs", type=int, default=5, help="best of this many runs per case")
+    args = parser.parse_args()
+
+    encoder = SPEC.encoder()
+    library = engine.JUSTIFICATIONS[0]
+    rendered = engine.generate_from_template(engine.TEMPLATES[0], TOPIC, "the Q4 \"freeze\" — again")
+
+    def encoded_json(selected: JustificationEntry) -> EncodedJSONResponse:
+        return EncodedJSONResponse(encoder.encode(selected, TOPIC))
+
+    def encoded_plain(selected: JustificationEntry) -> EncodedJSONResponse:
+        return EncodedJSONResponse(engine.encode_text(selected))
+
+    cases = [
+        ("JSON, library entry", library, models_json, encoded_json),
+        ("JSON, rendered template", rendered, models_json, encoded_json),
+        ("plain, library entry", library, models_plain, encoded_plain),
+    ]
+
+    def per_response_us(build: Callable[[JustificationEntry], object], selected: JustificationEntry) -> float:
+        best = float("inf")
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            for _ in range(args.responses):
+                build(selected)
+            best = min(best, time.perf_counter() - start)
+        return best / args.responses * 1e6
+
+    for name, selected, before, after in cases:
+        assert before(selected).body == after(selected).body, f"{name}: bodies differ"
+        models_us = per_response_us(before, selected)
+        encoded_us = per_response_us(after, selected)
+        print(f"{name:24s} models {models_us:6.2f} us  encoded {encoded_us:6.2f} us  ({models_us / encoded_us:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
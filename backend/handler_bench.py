@@ -0,0 +1,184 @@
+"""Handler benchmark: requests/s and latency of async vs sync (threadpool) GET handlers.
+
+Usage:
+
+    python handler_bench.py                      # uvicorn, 1000 concurrent connections
+    python handler_bench.py --connections 100 1000 2000 --requests 50000
+    python handler_bench.py --asgi               # no server: call the app in-process
+
+Serves the same GET handler twice from one app: as `async def`, the way
+engine_api runs the API handlers, and as plain `def`, the way they ran
+before, through Starlette's threadpool (40 threads by default). The handler
+body is the unseeded GET /jaas path: resolve the topic, select and record,
+encode the response. The app has no auth or rate limiting, so only how the
+handler is run differs.
+
+Each variant is loaded with --connections concurrent keep-alive clients
+sharing --requests requests, and reports requests per second with p50 and
+p99 latency. With --asgi, requests are ASGI calls on one event loop (each
+connection a different client IP) instead of HTTP to a uvicorn process (all
+from 127.0.0.1), so latency is only time in the app, including any wait for
+a free thread.
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Awaitable, Callable, List, Optional
+
+from fastapi import FastAPI, Request
+
+from app.libs import engine
+from app.libs.engine import Topic
+from app.libs.engine_api import client_host
+from app.libs.http_cache import EncodedJSONResponse
+from cold_start_bench import free_port
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+VARIANTS = ("sync", "async")
+ENCODER = engine.ResponseEncoder("justification", "justifications")
+CONTENT_LENGTH = re.compile(rb"\r\ncontent-length: *(\d+)", re.IGNORECASE)
+
+
+def select(request: Request, topic: Optional[Topic], context: Optional[str]) -> EncodedJSONResponse:
+    effective_topic = engine.resolve_topic(topic, context)
+    selected = engine.select_and_record(client_host(request), effective_topic, context, None, None, None)
+    return EncodedJSONResponse(ENCODER.encode(selected, effective_topic))
+
+
+async def get_async(request: Request, topic: Optional[Topic] = None, context: Optional[str] = None):
+    return select(request, topic, context)
+
+
+def get_sync(request: Request, topic: Optional[Topic] = None, context: Optional[str] = None):
+    return select(request, topic, context)
+
+
+app = FastAPI()
+app.add_api_route("/async", get_async, methods=["GET"])
+app.add_api_route("/sync", get_sync, methods=["GET"])
+
+
+async def load(connection: Callable[[List[float]], Awaitable[None]], connections: int) -> tuple[float, List[float]]:
+    """Runs `connections` clients concurrently. Returns (elapsed, latencies)."""
+    latencies: List[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(connection(latencies) for _ in range(connections)))
+    return time.perf_counter() - start, latencies
+
+
+def http_client(port: int, path: str, requests: int) -> Callable[[List[float]], Awaitable[None]]:
+    remaining = requests
+    message = f"GET {path} HTTP/1.1\r\nHost: bench\r\n\r\n".encode("ascii")
+
+    async def connection(latencies: List[float]) -> None:
+        nonlocal remaining
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                writer.write(message)
+                head = await reader.readuntil(b"\r\n\r\n")
+                await reader.readexactly(int(CONTENT_LENGTH.search(head).group(1)))
+                latencies.append(time.perf_counter() - start)
+                if not head.startswith(b"HTTP/1.1 200"):
+                    raise RuntimeError(f"{path} returned {head.splitlines()[0]!r}")
+        finally:
+            writer.close()
+
+    return connection
+
+
+def asgi_client(path: str, requests: int) -> Callable[[List[float]], Awaitable[None]]:
+    remaining = requests
+    client_ids = iter(range(1 << 16))
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def connection(latencies: List[float]) -> None:
+        nonlocal remaining
+        client_id = next(client_ids)
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+            "query_string": b"", "root_path": "", "headers": [(b"host", b"bench")],
+            "client": (f"10.0.{client_id // 256}.{client_id % 256}", 1), "server": ("bench", 80),
+        }
+        status = []
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            await app(dict(scope), receive, send)
+            latencies.append(time.perf_counter() - start)
+            if status.pop() != 200:
+                raise RuntimeError(f"{path} did not return 200")
+            await asyncio.sleep(0)  # Let the other connections in, like a network round trip
+
+    return connection
+
+
+def start_server(port: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "handler_bench:app", "--port", str(port),
+         "--log-level", "warning", "--backlog", "4096"],
+        cwd=BACKEND_DIR,
+    )
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/async", timeout=5):
+                return server
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.05)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connections", type=int, nargs="+", default=[1000])
+    parser.add_argument("--requests", type=int, default=20_000, help="per variant and connection count")
+    parser.add_argument("--asgi", action="store_true", help="call the app in-process instead of over http")
+    args = parser.parse_args()
+
+    port = free_port()
+    server = None if args.asgi else start_server(port)
+    try:
+        for connections in args.connections:
+            results = {}
+            for variant in VARIANTS:
+                path = f"/{variant}"
+
+                def client(requests: int):
+                    return asgi_client(path, requests) if args.asgi else http_client(port, path, requests)
+
+                asyncio.run(load(client(connections), connections))  # Warm up, not measured
+                elapsed, latencies = asyncio.run(load(client(args.requests), connections))
+                results[variant] = args.requests / elapsed
+                percentiles = statistics.quantiles(latencies, n=100)
+                print(
+                    f"{variant:5s} {connections:5d} connections  {results[variant]:8.0f} requests/s"
+                    f"  p50 {percentiles[49] * 1000:7.1f} ms  p99 {percentiles[98] * 1000:7.1f} ms"
+                    f"  ({results[variant] / results['sync']:.2f}x sync)"
+                )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
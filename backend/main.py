@@ -1,12 +1,51 @@
+import time
+
+# Startup timing starts before the heavy imports below, see create_app
+IMPORT_STARTED = time.perf_counter()
+
+import importlib
 import os
 import pathlib
 import json
 import dotenv
-from fastapi import FastAPI, APIRouter, Depends
+from fastapi import FastAPI, APIRouter
+from starlette.concurrency import run_in_threadpool
 
 dotenv.load_dotenv()
 
-from databutton_app.mw.auth_mw import AuthConfig, get_authorized_user
+from databutton_app.logs import get_logger, setup_logging
+
+setup_logging()
+log = get_logger("main")
+
+from databutton_app.mw.auth_mw import AuthConfig, AuthMiddleware, PathTable
+from databutton_app.mw.jwks import get_jwks_cache
+from databutton_app.mw.lazy_mw import LazyLoadMiddleware
+from databutton_app.mw.rate_limit_mw import RateLimit, RateLimiter, RateLimitMiddleware
+from shared.startup import LAZY_STARTUP, StartupTimer
+
+# Import-free, so lazy startup still defers loading the engine
+from app.libs.limits import MAX_BATCH_SIZE
+
+
+ROUTES_PREFIX = "/routes"
+
+# Per-route token buckets, enforced before routing and auth. Routes sharing a
+# bucket name share one budget per client. /jaas and /raas are one engine, so
+# all their generating routes share the "generate" bucket and alternating APIs
+# or switching to batches gains nothing. Batches are charged per item (see
+# charge_rate_limit) and streams are paced per item (see wait_rate_limit). The
+# burst holds one full batch; the sustained rate is the same for every route
+GENERATE_RATE_LIMIT = RateLimit(requests=60, period=60, burst=MAX_BATCH_SIZE, bucket="generate")
+RATE_LIMITS = {
+    "/routes/jaas": GENERATE_RATE_LIMIT,
+    "/routes/approve": GENERATE_RATE_LIMIT,
+    "/routes/raas": GENERATE_RATE_LIMIT,
+    "/routes/jaas/batch": GENERATE_RATE_LIMIT,
+    "/routes/raas/batch": GENERATE_RATE_LIMIT,
+    "/routes/jaas/stream": GENERATE_RATE_LIMIT,
+    "/routes/raas/stream": GENERATE_RATE_LIMIT,
+}
 
 
 def get_router_config() -> dict:
@@ -22,9 +61,16 @@ def is_auth_disabled(router_config: dict, name: str) -> bool:
     return router_config["routers"][name]["disableAuth"]
 
 
-def import_api_routers() -> APIRouter:
-    """Create top level router including all user defined endpoints."""
-    routes = APIRouter(prefix="/routes")
+def import_api_routers(
+    timer: StartupTimer | None = None,
+) -> tuple[APIRouter, list[str]]:
+    """
+    Create top level router including all user defined endpoints. Also returns
+    the paths of routes with auth disabled, for the AuthMiddleware.
+    """
+    timer = timer or StartupTimer()
+    routes = APIRouter(prefix=ROUTES_PREFIX)
+    public_paths: list[str] = []
 
     router_config = get_router_config()
 
@@ -41,26 +87,41 @@ def import_api_routers() -> APIRouter:
     api_module_prefix = "app.apis."
 
     for name in api_names:
-        print(f"Importing API: {name}")
+        log.info("Importing API: %s", name)
         try:
-            api_module = __import__(api_module_prefix + name, fromlist=[name])
+            with timer.phase(f"api:{name}"):
+                api_module = importlib.import_module(api_module_prefix + name)
             api_router = getattr(api_module, "router", None)
             if isinstance(api_router, APIRouter):
-                routes.include_router(
-                    api_router,
-                    dependencies=(
-                        []
-                        if is_auth_disabled(router_config, name)
-                        else [Depends(get_authorized_user)]
-                    ),
-                )
-        except Exception as e:
-            print(e)
+                # Looked up first: an API without a routers.json entry is skipped
+                auth_disabled = is_auth_disabled(router_config, name)
+                routes.include_router(api_router)
+                if auth_disabled:
+                    public_paths += [
+                        routes.prefix + route.path
+                        for route in api_router.routes
+                        if hasattr(route, "path")
+                    ]
+        except Exception:
+            log.exception("Failed to import API: %s", name)
             continue
 
-    print(routes.routes)
+    log.debug("API routes: %s", routes.routes)
+
+    return routes, public_paths
+
 
-    return routes
+def log_routes(app: FastAPI) -> None:
+    # One message: per-route lines would trip the log's per-message rate limit
+    log.info(
+        "Routes: %s",
+        ", ".join(
+            f"{method} {route.path}"
+            for route in app.routes
+            if hasattr(route, "methods")
+            for method in route.methods
+        ),
+    )
 
 
 def get_firebase_config() -> dict | None:
@@ -74,30 +135,84 @@ def get_firebase_config() -> dict | None:
     return None
 
 
+def build_auth_config() -> AuthConfig | None:
+    firebase_config = get_firebase_config()
+
+    if firebase_config is None:
+        log.info("No firebase config found")
+        return None
+
+    log.info("Firebase config found")
+    auth_config = {
+        # AUTH_JWKS_URL can point at a local file (file:// or a path) or a
+        # stand-in server, e.g. for tests and air-gapped runs
+        "jwks_url": os.environ.get(
+            "AUTH_JWKS_URL",
+            "https://www.googleapis.com/service_accounts/v1/jwk/securetoken@system.gserviceaccount.com",
+        ),
+        "audience": firebase_config["projectId"],
+        "header": "authorization",
+    }
+    return AuthConfig(**auth_config)
+
+
 def create_app() -> FastAPI:
     """Create the app. This is called by uvicorn with the factory option to construct the app object."""
-    app = FastAPI()
-    app.include_router(import_api_routers())
-
-    for route in app.routes:
-        if hasattr(route, "methods"):
-            for method in route.methods:
-                print(f"{method} {route.path}")
+    timer = StartupTimer(started=IMPORT_STARTED)
+    timer.timings["imports"] = round((time.perf_counter() - IMPORT_STARTED) * 1000, 1)
 
-    firebase_config = get_firebase_config()
+    with timer.phase("auth"):
+        auth_config = build_auth_config()
+        if auth_config is not None:
+            # Fetch signing keys (and import jwt) on a background thread, so
+            # the fetch overlaps with loading the routers, and keep them fresh
+            get_jwks_cache(auth_config.jwks_url).start()
 
-    if firebase_config is None:
-        print("No firebase config found")
-        app.state.auth_config = None
+    app = FastAPI()
+    app.state.auth_config = auth_config
+    # Filled in once the routers are loaded; the AuthMiddleware reads it live
+    public_paths = PathTable()
+
+    def install_routers(routes: APIRouter, paths: list[str]) -> None:
+        app.include_router(routes)
+        public_paths.add(paths)
+        log_routes(app)
+
+    if LAZY_STARTUP:
+        # Routers, and the engine and corpus behind them, are imported on the
+        # first API (or schema) request, in the threadpool so other paths
+        # keep being served, instead of before the app starts
+        async def load_routers() -> None:
+            with timer.phase("routers"):
+                install_routers(*await run_in_threadpool(import_api_routers, timer))
+            log.info("Loaded routers on first request", extra={"phases": timer.timings})
     else:
-        print("Firebase config found")
-        auth_config = {
-            "jwks_url": "https://www.googleapis.com/service_accounts/v1/jwk/securetoken@system.gserviceaccount.com",
-            "audience": firebase_config["projectId"],
-            "header": "authorization",
-        }
-
-        app.state.auth_config = AuthConfig(**auth_config)
+        with timer.phase("routers"):
+            install_routers(*import_api_routers(timer))
+
+    with timer.phase("middleware"):
+        # Added first, so it runs inside the rate limiter below: over-limit
+        # requests are rejected before their token is checked
+        app.add_middleware(AuthMiddleware, public_paths=public_paths, prefix=ROUTES_PREFIX)
+
+        if LAZY_STARTUP:
+            # Outside auth, which needs the public paths of the loaded routers.
+            # The OpenAPI schema is cached on first use, so it waits for them too
+            app.add_middleware(
+                LazyLoadMiddleware, load=load_routers, prefixes=(ROUTES_PREFIX, app.openapi_url)
+            )
+
+        app.state.rate_limiter = RateLimiter(RATE_LIMITS)
+        app.add_middleware(RateLimitMiddleware, limiter=app.state.rate_limiter)
+
+    # Per-phase wall times in ms; phases may overlap (api:* are within routers).
+    # With LAZY_STARTUP, routers and api:* are added by the first request.
+    app.state.startup_timings = timer.timings
+    log.info(
+        "Started in %.1f ms",
+        timer.total(),
+        extra={"phases": timer.timings, "lazy_startup": LAZY_STARTUP},
+    )
 
     return app
 
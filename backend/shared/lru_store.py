@@ -0,0 +1,231 @@
+"""Capacity-bounded key/value store with LRU + TTL eviction.
+
+Usage:
+
+    from shared.lru_store import LruTtlStore
+
+    store = LruTtlStore(max_entries=100_000, ttl=3600)
+    state = store.get(key)
+    if state is None:
+        state = store[key] = make_state()
+
+    store.stats()  # -> {"size": ..., "capacity": ..., "evictions": {...}}
+
+    # Same interface, split by key hash so different keys rarely share a lock
+    store = ShardedLruTtlStore(shards=64, max_entries=100_000, ttl=3600)
+
+Entries idle for longer than `ttl` are dropped, and once the store is full the
+least recently used entry makes room. The capacity is a hard ceiling: it is
+`max_entries`, lowered further if `max_bytes` / `entry_bytes` is smaller. A
+single shared daemon janitor sweeps expired entries from all stores, so idle
+entries are released even when no new ones arrive.
+
+Used by both the app (per-client history) and databutton_app (rate limit
+buckets, verified tokens, unknown JWKS kids), so it lives outside both.
+"""
+
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+JANITOR_INTERVAL = 30.0  # seconds
+
+
+class LruTtlStore(Generic[V]):
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float,
+        max_bytes: Optional[int] = None,
+        entry_bytes: int = 1024,
+    ):
+        if max_entries <= 0:
+            raise ValueError(f"max_entries must be positive, got {max_entries}")
+        capacity = max_entries
+        if max_bytes is not None:
+            capacity = min(capacity, max(1, max_bytes // entry_bytes))
+
+        self.capacity = capacity
+        self.ttl = ttl
+        self.entry_bytes = entry_bytes
+        self._lock = threading.Lock()
+        # key -> (last access, value), least recently used first
+        self._entries: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self._evictions: Dict[str, int] = {"lru": 0, "ttl": 0}
+
+        _register(self)
+
+    def get(self, key: Hashable, default: Optional[V] = None) -> Optional[V]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return default
+            if now - item[0] > self.ttl:
+                del self._entries[key]
+                self._evictions["ttl"] += 1
+                return default
+            self._entries[key] = (now, item[1])
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def __setitem__(self, key: Hashable, value: V) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                self._evict_expired(now)
+                while len(self._entries) >= self.capacity:
+                    self._entries.popitem(last=False)
+                    self._evictions["lru"] += 1
+            self._entries[key] = (now, value)
+
+    def __getitem__(self, key: Hashable) -> V:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def pop(self, key: Hashable, default: Optional[V] = None) -> Optional[V]:
+        with self._lock:
+            item = self._entries.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def sweep(self) -> int:
+        """Drops expired entries. Returns how many were evicted."""
+        with self._lock:
+            return self._evict_expired(time.monotonic())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._entries)
+            evictions = dict(self._evictions)
+        return {
+            "size": size,
+            "capacity": self.capacity,
+            "approx_bytes": size * self.entry_bytes,
+            "evictions": evictions,
+        }
+
+    def _evict_expired(self, now: float) -> int:
+        # Entries are in access order, so expired ones are all at the front
+        evicted = 0
+        while self._entries:
+            key, (last_access, _) = next(iter(self._entries.items()))
+            if now - last_access <= self.ttl:
+                break
+            del self._entries[key]
+            evicted += 1
+        self._evictions["ttl"] += evicted
+        return evicted
+
+
+class ShardedLruTtlStore(Generic[V]):
+    """
+    An LruTtlStore split into `shards` independent stores by key hash, so
+    concurrent requests for different keys rarely contend on one store lock.
+    Capacity and `max_bytes` are divided evenly, and LRU order is kept per
+    shard, so eviction is only approximately least-recently-used overall.
+    """
+
+    def __init__(
+        self,
+        shards: int,
+        max_entries: int,
+        ttl: float,
+        max_bytes: Optional[int] = None,
+        entry_bytes: int = 1024,
+    ):
+        if shards <= 0:
+            raise ValueError(f"Shard count must be positive, got {shards}")
+        self._shards: List[LruTtlStore[V]] = [
+            LruTtlStore(
+                max_entries=max(1, max_entries // shards),
+                ttl=ttl,
+                max_bytes=None if max_bytes is None else max_bytes // shards,
+                entry_bytes=entry_bytes,
+            )
+            for _ in range(shards)
+        ]
+        self.capacity = sum(shard.capacity for shard in self._shards)
+        self.ttl = ttl
+
+    def shard_for(self, key: Hashable) -> LruTtlStore[V]:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def get(self, key: Hashable, default: Optional[V] = None) -> Optional[V]:
+        return self.shard_for(key).get(key, default)
+
+    def __setitem__(self, key: Hashable, value: V) -> None:
+        self.shard_for(key)[key] = value
+
+    def __getitem__(self, key: Hashable) -> V:
+        return self.shard_for(key)[key]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.shard_for(key)
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def pop(self, key: Hashable, default: Optional[V] = None) -> Optional[V]:
+        return self.shard_for(key).pop(key, default)
+
+    def clear(self) -> None:
+        for shard in self._shards:
+            shard.clear()
+
+    def sweep(self) -> int:
+        return sum(shard.sweep() for shard in self._shards)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = [shard.stats() for shard in self._shards]
+        return {
+            "size": sum(s["size"] for s in stats),
+            "capacity": self.capacity,
+            "approx_bytes": sum(s["approx_bytes"] for s in stats),
+            "evictions": {
+                kind: sum(s["evictions"][kind] for s in stats) for kind in ("lru", "ttl")
+            },
+            "shards": len(stats),
+        }
+
+
+# --- Shared Janitor ---
+
+_stores: "weakref.WeakSet[LruTtlStore]" = weakref.WeakSet()
+_janitor: Optional[threading.Thread] = None
+_janitor_lock = threading.Lock()
+
+
+def _janitor_loop() -> None:
+    while True:
+        time.sleep(JANITOR_INTERVAL)
+        for store in list(_stores):
+            store.sweep()
+
+
+def _register(store: LruTtlStore) -> None:
+    global _janitor
+    _stores.add(store)
+    with _janitor_lock:
+        if _janitor is None:
+            _janitor = threading.Thread(
+                target=_janitor_loop, name="lru-store-janitor", daemon=True
+            )
+            _janitor.start()
@@ -0,0 +1,43 @@
+"""Startup mode and per-phase startup timing.
+
+Usage:
+
+    from shared.startup import LAZY_STARTUP, StartupTimer
+
+    timer = StartupTimer()
+    with timer.phase("routers"):
+        routes = import_api_routers()
+    app.state.startup_timings = timer.timings  # {"routers": 41.2, ...} in ms
+
+DATABUTTON_LAZY_STARTUP=1 defers work that the first requests can do
+themselves, so the app starts serving sooner: the API routers (and with them
+the engine and its corpus) are imported on the first request under /routes,
+and the engine's candidate pool tables are built on first use.
+"""
+
+import contextlib
+import os
+import time
+from typing import Dict, Iterator, Optional
+
+LAZY_STARTUP = os.environ.get("DATABUTTON_LAZY_STARTUP", "").lower() in ("1", "true", "yes")
+
+
+class StartupTimer:
+    """Wall time per named startup phase, in milliseconds."""
+
+    def __init__(self, started: Optional[float] = None):
+        # perf_counter() value startup began at, if earlier than now
+        self.started = time.perf_counter() if started is None else started
+        self.timings: Dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    def total(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 1)
@@ -0,0 +1,145 @@
+"""Stress benchmark: selection throughput as threadpool workers are added.
+
+Usage:
+
+    python stress_bench.py                      # 1, 2, 4, 8, 16 and 32 workers
+    python stress_bench.py --workers 1 8 64 --requests 20000 --clients 500
+    python stress_bench.py --switch-interval 1e-6   # force frequent thread switches
+
+Each run submits `--requests` calls to engine.select_and_record, spread over
+`--clients` client IPs, to a ThreadPoolExecutor with the given number of
+workers, the same way Starlette runs sync work in its threadpool. Every
+worker count runs each workload:
+
+- generic: no filters, the common case,
+- no-variants: intensity=1, where the "No." variants compete, so their 1%
+  cap is actually reached,
+- bees: tone=unhinged, intensity=5, where BEES competes, so its cooldown is
+  actually hit.
+
+After each run it checks that concurrent updates were not lost and no rule
+was broken:
+
+- REQUEST_COUNTER advanced by exactly one per request,
+- every client's history holds min(its requests, HISTORY_SIZE) entries,
+- the rolling window holds min(requests so far, GLOBAL_WINDOW_SIZE) entries,
+- the "No." variants stay within their 1% share of the window,
+- BEES was recorded at request indices at least its cooldown apart.
+
+Selection is pure-Python CPU work, so under the GIL throughput should stay
+roughly flat as workers are added. A drop with more workers points at lock
+contention. With the default 5 ms GIL switch interval, threads rarely switch
+inside a selection. --switch-interval 1e-6 makes them switch constantly,
+which exposes races (at the cost of meaningful throughput numbers).
+"""
+
+import argparse
+import itertools
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from app.libs import engine
+
+# name -> (tone, intensity)
+WORKLOADS: Dict[str, Tuple[Optional[engine.Tone], Optional[int]]] = {
+    "generic": (None, None),
+    "no-variants": (None, 1),
+    "bees": (engine.Tone.unhinged, 5),
+}
+
+BEES_CODES = {e.code for e in engine.JUSTIFICATIONS if e.id == engine.BEES_ID}
+BEES_COOLDOWN = next(r.cooldown_requests for r in engine.SELECTION_RULES if engine.BEES_ID in r.ids)
+
+
+class RecordLog:
+    """Wraps RULE_ENGINE.record to collect the request indices BEES was recorded at."""
+
+    def __init__(self):
+        self.bees: List[int] = []
+        self._lock = threading.Lock()
+        self._record = engine.RULE_ENGINE.record
+        engine.RULE_ENGINE.record = self.record
+
+    def record(self, code: int, request_index: int, now: float, force: bool = False) -> bool:
+        recorded = self._record(code, request_index, now, force)
+        if recorded and code in BEES_CODES:
+            with self._lock:
+                self.bees.append(request_index)
+        return recorded
+
+
+def run(workers: int, requests: int, clients: list[str], workload: str, log: RecordLog) -> float:
+    """Returns requests per second. Raises AssertionError if state was lost."""
+    tone, intensity = WORKLOADS[workload]
+    counter_before = next(engine.REQUEST_COUNTER)
+    window_before = len(engine.GLOBAL_ROLLING_WINDOW)
+    client_ips = [clients[i % len(clients)] for i in range(requests)]
+
+    def select(client_ip: str) -> None:
+        engine.select_and_record(client_ip, engine.Topic.generic, None, tone, intensity, None)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        start = time.perf_counter()
+        for _ in pool.map(select, client_ips):
+            pass
+        elapsed = time.perf_counter() - start
+
+    counted = next(engine.REQUEST_COUNTER) - counter_before - 1
+    assert counted == requests, f"counter advanced by {counted}, expected {requests}"
+
+    per_client, extra = divmod(requests, len(clients))
+    for i, client_ip in enumerate(clients):
+        expected = min(per_client + (i < extra), engine.HISTORY_SIZE)
+        actual = len(engine.get_history(client_ip))
+        assert actual == expected, f"{client_ip} has {actual} history entries, expected {expected}"
+
+    window = len(engine.GLOBAL_ROLLING_WINDOW)
+    assert window == min(window_before + requests, engine.GLOBAL_WINDOW_SIZE), f"window has {window} entries"
+    capped = engine.GLOBAL_ROLLING_WINDOW.count("no_variants")
+    assert capped <= engine.GLOBAL_WINDOW_SIZE * 0.01, f"{capped} 'No.' variants in the window"
+
+    bees = sorted(log.bees)
+    gaps = [b - a for a, b in zip(bees, bees[1:])]
+    assert not gaps or min(gaps) >= BEES_COOLDOWN, f"BEES recorded {min(gaps)} requests apart"
+
+    return requests / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests", type=int, default=10_000)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=3, help="best of this many runs per worker count")
+    parser.add_argument("--workloads", nargs="+", choices=list(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument("--switch-interval", type=float, help="GIL switch interval in seconds (sys.setswitchinterval)")
+    args = parser.parse_args()
+    if args.switch_interval:
+        sys.setswitchinterval(args.switch_interval)
+
+    log = RecordLog()
+    run_ids = itertools.count()
+    for workload in args.workloads:
+        baseline = None
+        for workers in args.workers:
+            rates = []
+            for _ in range(args.runs):
+                # Fresh clients each run, so history checks start from empty
+                run_id = next(run_ids)
+                clients = [f"10.{run_id}.{i // 256}.{i % 256}" for i in range(args.clients)]
+                rates.append(run(workers, args.requests, clients, workload, log))
+
+            best = max(rates)
+            baseline = baseline or best
+            print(
+                f"{workload:12s} {workers:3d} workers  {best:9.0f} selections/s  ({best / baseline:.2f}x)"
+                f"  state consistent, 'No.' in window: {engine.GLOBAL_ROLLING_WINDOW.count('no_variants')},"
+                f" BEES recorded: {len(log.bees)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
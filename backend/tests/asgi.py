@@ -0,0 +1,25 @@
+"""Sends one request straight to an ASGI app, with full control of the scope."""
+
+import asyncio
+
+from starlette.types import ASGIApp
+
+
+def request_status(app: ASGIApp, method: str, path: str, root_path: str = "") -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": root_path, "query_string": b"", "headers": [(b"host", b"test")],
+        "client": ("127.0.0.1", 1), "server": ("test", 80),
+    }
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    asyncio.run(app(scope, receive, send))
+    return status[0]
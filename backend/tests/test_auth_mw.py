@@ -0,0 +1,36 @@
+from fastapi import APIRouter, FastAPI
+
+from databutton_app.mw.auth_mw import AuthMiddleware, PathTable
+from tests.asgi import request_status
+
+
+def make_app() -> FastAPI:
+    router = APIRouter(prefix="/routes")
+
+    @router.get("/secret")
+    async def secret():
+        return {"ok": True}
+
+    @router.get("/open")
+    async def open_route():
+        return {"ok": True}
+
+    app = FastAPI()
+    app.state.auth_config = None  # No credentials can ever be valid
+    app.include_router(router)
+    app.add_middleware(AuthMiddleware, public_paths=PathTable(["/routes/open"]), prefix="/routes")
+    return app
+
+
+def test_unauthenticated_request_is_rejected():
+    assert request_status(make_app(), "GET", "/routes/secret") == 401
+
+
+def test_unauthenticated_request_under_root_path_is_rejected():
+    # Behind a path-prefix proxy scope["path"] includes the root_path, but the
+    # router still serves the route, so auth must match it the same way
+    assert request_status(make_app(), "GET", "/api/routes/secret", root_path="/api") == 401
+
+
+def test_public_path_under_root_path_is_served():
+    assert request_status(make_app(), "GET", "/api/routes/open", root_path="/api") == 200
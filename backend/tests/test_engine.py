@@ -0,0 +1,20 @@
+import random
+
+from app.libs import engine
+from app.libs.client_history import ClientHistory
+
+
+def test_context_only_template_is_excluded_by_history():
+    template = next(t for t in engine.TEMPLATES if t.context_only)
+    rendered = engine.generate_from_template(template, engine.Topic.generic, "the thing")
+    assert engine.rendered_id(template, "the thing") == rendered.id
+
+    history = ClientHistory(engine.HISTORY_SIZE)
+    history.append(rendered.id)
+    tone = engine.TONES[template.tone]
+    for seed in range(200):
+        selected = engine.select_from_pool(
+            engine.Topic.generic, "the thing", tone, template.intensity, None,
+            history, frozenset(), random.Random(seed),
+        )
+        assert selected.id != rendered.id
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, FastAPI
+
+from databutton_app.mw.lazy_mw import LazyLoadMiddleware
+from tests.asgi import request_status
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+
+    async def load() -> None:
+        router = APIRouter(prefix="/routes")
+
+        @router.get("/jaas")
+        async def jaas():
+            return {"ok": True}
+
+        app.include_router(router)
+
+    app.add_middleware(LazyLoadMiddleware, load=load, prefixes=("/routes",))
+    return app
+
+
+def test_first_request_loads_routers():
+    assert request_status(make_app(), "GET", "/routes/jaas") == 200
+
+
+def test_first_request_under_root_path_loads_routers():
+    assert request_status(make_app(), "GET", "/api/routes/jaas", root_path="/api") == 200
+
+
+def test_other_paths_do_not_load():
+    app = make_app()
+    assert request_status(app, "GET", "/elsewhere") == 404
+    assert not any(getattr(r, "path", "") == "/routes/jaas" for r in app.routes)
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, FastAPI, Request
+
+from databutton_app.mw.rate_limit_mw import (
+    RateLimit,
+    RateLimiter,
+    RateLimitMiddleware,
+    charge_rate_limit,
+)
+from tests.asgi import request_status
+
+
+def make_app() -> FastAPI:
+    router = APIRouter(prefix="/routes")
+
+    @router.get("/jaas")
+    async def jaas():
+        return {"ok": True}
+
+    @router.post("/jaas/batch")
+    async def batch(request: Request):
+        charge_rate_limit(request, 4)  # Five items
+        return {"ok": True}
+
+    app = FastAPI()
+    app.include_router(router)
+    app.state.rate_limiter = RateLimiter({
+        "/routes/jaas": RateLimit(requests=3, period=60, bucket="generate"),
+        "/routes/jaas/batch": RateLimit(requests=3, period=60, burst=10, bucket="batch"),
+    })
+    app.add_middleware(RateLimitMiddleware, limiter=app.state.rate_limiter)
+    return app
+
+
+def test_limit_applies_under_root_path():
+    app = make_app()
+    statuses = [request_status(app, "GET", "/api/routes/jaas", root_path="/api") for _ in range(5)]
+    assert statuses == [200, 200, 200, 429, 429]
+
+
+def test_handler_charges_under_root_path():
+    app = make_app()
+    # Each batch costs 5 of the 10 tokens; the third cannot be paid for
+    statuses = [request_status(app, "POST", "/api/routes/jaas/batch", root_path="/api") for _ in range(3)]
+    assert statuses == [200, 200, 429]
+
+
+def test_evicted_bucket_does_not_refill_early():
+    # 10 tokens at 3/min take 200 s to refill, longer than the 60 s period
+    limiter = make_app().state.rate_limiter
+    assert limiter.buckets.ttl == 200
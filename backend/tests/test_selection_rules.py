@@ -0,0 +1,39 @@
+from app.libs.selection_rules import RuleEngine, SelectionRule
+
+
+def make_engine() -> RuleEngine:
+    engine = RuleEngine(window_size=100)
+    engine.load(
+        [SelectionRule(name="bees", ids={"bees"}, cooldown_requests=200)],
+        items=[("bees", 0), ("other", 1)],
+    )
+    return engine
+
+
+def test_record_refuses_a_code_on_cooldown():
+    engine = make_engine()
+    assert engine.record(0, 100, 0.0)
+    assert 0 in engine.blocked
+    # A concurrent request that read the blocklist before the first record
+    assert not engine.record(0, 101, 0.0)
+    assert engine.record(1, 101, 0.0)
+
+
+def test_out_of_order_record_cannot_shorten_cooldown():
+    engine = make_engine()
+    assert engine.record(0, 300, 0.0)
+    # A lower index recording later must not move the deadline back to 299
+    assert not engine.record(0, 99, 0.0)
+    engine.expire(350, 0.0)
+    assert 0 in engine.blocked
+    engine.expire(500, 0.0)
+    assert 0 not in engine.blocked
+
+
+def test_stale_index_cannot_record_after_expiry():
+    engine = make_engine()
+    assert engine.record(0, 100, 0.0)
+    engine.expire(300, 0.0)  # Lifted by a request with a higher index
+    assert 0 not in engine.blocked
+    assert not engine.record(0, 250, 0.0)
+    assert engine.record(0, 300, 0.0)